@@ -0,0 +1,206 @@
+"""Headless batch analysis for PixelInspector-Pro.
+
+Runs sampling, RGBA range filters, channel statistics and match export over
+many images in a process pool without importing Qt widgets:
+
+    python pixel_batch.py ./scans --filter r=200:255 --stats -o results.jsonl
+"""
+import os
+import sys
+import glob
+import json
+import hashlib
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from pixel_analysis import (
+    ChannelMaskFilter, FilterExpression, channel_stats, load_pixels, mask_bounding_box,
+    sample_pixels, write_matches_csv
+)
+
+
+BATCH_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".npy")
+
+
+def iter_batch_inputs(inputs, recursive=False):
+    # Yield image paths from files, directories and glob patterns, lazily so
+    # huge batches are never listed in memory at once
+    for entry in inputs:
+        if os.path.isdir(entry):
+            if recursive:
+                for root, _, names in os.walk(entry):
+                    for name in sorted(names):
+                        if name.lower().endswith(BATCH_EXTENSIONS):
+                            yield os.path.join(root, name)
+            else:
+                with os.scandir(entry) as scan:
+                    for item in scan:
+                        if item.is_file() and item.name.lower().endswith(BATCH_EXTENSIONS):
+                            yield item.path
+        elif glob.has_magic(entry):
+            yield from glob.iglob(entry, recursive=True)
+        else:
+            yield entry
+
+
+def export_name(image_path):
+    # CSV name for an image's matches; a short hash of the absolute path keeps
+    # same-named images from different directories apart
+    digest = hashlib.sha1(os.fsencode(os.path.abspath(image_path))).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(image_path))[0]}-{digest}.csv"
+
+
+def parse_batch_query(args):
+    # Merge the JSON query (file or inline) with the command line shortcuts
+    query = {}
+    if args.query:
+        if os.path.isfile(args.query):
+            with open(args.query) as file:
+                query = json.load(file)
+        else:
+            query = json.loads(args.query)
+            
+    samples = list(query.get("samples", []))
+    for sample in args.sample:
+        x, y = sample.split(",")
+        samples.append([int(x), int(y)])
+        
+    filters = dict(query.get("filter", {}))
+    for item in args.filter:
+        channel, limits = item.split("=")
+        low, _, high = limits.partition(":")
+        filters[channel.strip().lower()] = [int(low), int(high or low)]
+    unknown = set(filters) - set("rgba")
+    if unknown:
+        raise ValueError(f"Unknown filter channel(s): {', '.join(sorted(unknown))}")
+        
+    expression = args.expression or query.get("expression")
+    if expression:
+        # Fail on a bad expression before any worker starts
+        FilterExpression(expression)
+        
+    return {
+        "samples": samples,
+        "filter": filters,
+        "expression": expression,
+        "stats": bool(query.get("stats", False) or args.stats),
+        "export_matches": bool(query.get("export_matches", False) or args.export_dir),
+    }
+
+
+def analyze_image_file(image_path, query, export_dir=None):
+    # Batch worker: decode one image and answer the query. Only the small
+    # result dict travels back to the parent process.
+    result = {"path": image_path}
+    try:
+        result["bytes"] = os.path.getsize(image_path)
+        pixels = load_pixels(image_path)
+        height, width = pixels.shape[:2]
+        result["width"], result["height"] = width, height
+        
+        if query["samples"]:
+            coords = np.asarray(query["samples"], dtype=np.int64).reshape(-1, 2)
+            values, inside = sample_pixels(pixels, coords[:, 0], coords[:, 1])
+            samples = [None] * len(coords)
+            for index, value in zip(np.flatnonzero(inside).tolist(), values.tolist()):
+                samples[index] = coords[index].tolist() + value
+            result["samples"] = samples
+            
+        if query["stats"]:
+            result["stats"] = channel_stats(pixels)
+            
+        if query["filter"] or query.get("expression"):
+            mask = None
+            if query["filter"]:
+                mask = ChannelMaskFilter(pixels).evaluate([query["filter"].get(channel) for channel in "rgba"])
+            if query.get("expression"):
+                # Images are already spread over processes, so one thread each
+                matches = FilterExpression(query["expression"]).evaluate(pixels, workers=1)
+                mask = matches if mask is None else mask & matches
+            result["matches"] = int(np.count_nonzero(mask))
+            result["bounds"] = mask_bounding_box(mask)
+            if export_dir and query["export_matches"]:
+                result["export"] = os.path.join(export_dir, export_name(image_path))
+                write_matches_csv(result["export"], pixels, mask)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def run_batch(argv):
+    parser = argparse.ArgumentParser(
+        prog="pixel_batch.py",
+        description="Analyze many images headlessly across a process pool."
+    )
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-q", "--query", help="JSON query spec (file path or inline JSON)")
+    parser.add_argument("-s", "--sample", action="append", default=[], metavar="X,Y",
+                        help="sample the RGBA value at X,Y (repeatable)")
+    parser.add_argument("-f", "--filter", action="append", default=[], metavar="C=LOW:HIGH",
+                        help="count pixels with channel C in [LOW, HIGH] (repeatable)")
+    parser.add_argument("-e", "--expression", metavar="EXPR",
+                        help="count pixels matching a filter expression, e.g. \"r > 200 & a < 128\"")
+    parser.add_argument("--stats", action="store_true", help="compute per-channel statistics")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSON lines results file (default: stdout)")
+    parser.add_argument("--export-dir", help="write matching pixels of each image here as NAME-HASH.csv, "
+                        "HASH being a short hash of the image path")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-r", "--recursive", action="store_true", help="recurse into directories")
+    args = parser.parse_args(argv)
+    
+    try:
+        query = parse_batch_query(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.export_dir:
+        os.makedirs(args.export_dir, exist_ok=True)
+        
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    workers = max(1, args.workers)
+    processed = failed = total_bytes = total_pixels = 0
+    start = time.perf_counter()
+    
+    def record(result):
+        nonlocal processed, failed, total_bytes, total_pixels
+        processed += 1
+        if "error" in result:
+            failed += 1
+        total_bytes += result.get("bytes", 0)
+        total_pixels += result.get("width", 0) * result.get("height", 0)
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        
+    # Keep at most two tasks per worker in flight so memory stays bounded
+    # however many inputs there are; results are written as they complete
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for image_path in iter_batch_inputs(args.inputs, args.recursive):
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+                pending.add(pool.submit(analyze_image_file, image_path, query, args.export_dir))
+            for future in wait(pending).done:
+                record(future.result())
+    finally:
+        if output is not sys.stdout:
+            output.close()
+            
+    elapsed = time.perf_counter() - start
+    print(
+        f"Processed {processed} images ({failed} failed) in {elapsed:.2f}s with {workers} workers: "
+        f"{processed / elapsed if elapsed else 0:.2f} images/s, "
+        f"{total_bytes / 1e6 / elapsed if elapsed else 0:.2f} MB/s, "
+        f"{total_pixels / 1e6 / elapsed if elapsed else 0:.2f} MP/s",
+        file=sys.stderr
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_batch(sys.argv[1:]))
@@ -0,0 +1,437 @@
+"""Offscreen benchmarks for PixelInspector-Pro.
+
+Drives the real RGBAnalyzer window under Qt's offscreen platform with
+synthetic images and synthetic mouse event streams, and records latency
+percentiles, throughput and peak RSS for each scenario and image size:
+
+    python pixel_bench.py --sizes 1,16,64 -o bench.json
+    python pixel_bench.py --sizes 1,16,64 --compare bench.json
+
+Results are written as JSON, so runs on different revisions can be compared.
+"""
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from pixel_analysis import FilterExpression, decode_image, export_pixels, iter_array_chunks
+from pixel_perf import current_rss_bytes
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS falls back to the current RSS there
+    resource = None
+
+
+SCENARIOS = (
+    "load", "analysis", "hover", "hover_zoomed", "click", "filter_live", "filter_expression",
+    "select_matches", "table_scroll", "apply_filters", "export_csv", "export_npy",
+)
+
+
+def synthetic_pixels(megapixels, seed=0):
+    # 4:3 RGBA noise. Noise defeats every shortcut based on repeated colours
+    # or runs, so it measures the worst case of each path.
+    width = max(1, round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = max(1, round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    for top in range(0, height, 1024):
+        rows = pixels[top:top + 1024]
+        rows[...] = rng.integers(0, 256, rows.shape, dtype=np.uint8)
+    return pixels
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its own high-water mark; elsewhere the peak
+    # is the process-wide maximum so far
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return current_rss_bytes()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(samples, items=None):
+    # Latency percentiles in milliseconds; throughput in operations, or in
+    # items (pixels, rows) when a count is given, per second
+    seconds = np.asarray(samples, dtype=np.float64)
+    total = float(seconds.sum())
+    p50, p90, p99 = np.percentile(seconds, (50, 90, 99)) * 1000 if len(seconds) else (0.0, 0.0, 0.0)
+    summary = {
+        "count": len(seconds),
+        "total_s": round(total, 6),
+        "mean_ms": round(total / max(len(seconds), 1) * 1000, 4),
+        "p50_ms": round(float(p50), 4),
+        "p90_ms": round(float(p90), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(seconds.max()) * 1000, 4) if len(seconds) else 0.0,
+        "ops_per_s": round(len(seconds) / total, 3) if total else None,
+    }
+    if items is not None:
+        summary["items"] = int(items)
+        summary["items_per_s"] = round(items / total, 1) if total else None
+    return summary
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+class BenchmarkRun:
+    # One RGBAnalyzer window reused for every image size, so the numbers
+    # include the signal handlers and widgets a user's session would run
+    def __init__(self, args, work_dir):
+        from PySide6.QtWidgets import QApplication
+        from rgba_analyzer import RGBAnalyzer
+        self.args = args
+        self.work_dir = work_dir
+        self.app = QApplication.instance() or QApplication([sys.argv[0]])
+        self.window = RGBAnalyzer()
+        self.window.resize(1400, 900)
+        self.window.show()
+        self.wait(50)
+        self.rng = np.random.default_rng(args.seed)
+        self.results = []
+        
+    def wait(self, ms=0):
+        # QTest.qWait runs the event loop without the processEvents wrapper,
+        # which leaks a reference per call on some PySide builds
+        from PySide6.QtTest import QTest
+        QTest.qWait(ms)
+        
+    def record(self, size, name, summary, peak):
+        summary = dict(summary, size_mp=size, scenario=name,
+                       peak_rss_mb=None if peak is None else round(peak / 1048576, 1))
+        self.results.append(summary)
+        peak_mb = "n/a" if peak is None else f"{summary['peak_rss_mb']:.1f}"
+        print(
+            f"{size:>6g} MP  {name:<18} p50 {summary['p50_ms']:>10.3f} ms  p99 {summary['p99_ms']:>10.3f} ms"
+            f"  n={summary['count']:<5} peak {peak_mb:>8} MB",
+            file=sys.stderr
+        )
+        
+    def run_size(self, size):
+        from PySide6.QtGui import QImage
+        pixels = synthetic_pixels(size, self.args.seed)
+        height, width = pixels.shape[:2]
+        image_path = os.path.join(self.work_dir, f"bench_{size:g}mp.bmp")
+        QImage(pixels.data, width, height, width * 4, QImage.Format_RGBA8888).save(image_path)
+        del pixels
+        
+        for name in self.args.scenarios:
+            reset_peak_rss()
+            summary = getattr(self, f"bench_{name}")(image_path)
+            self.record(size, name, summary, peak_rss_bytes())
+        
+        os.remove(image_path)
+        
+    def bench_load(self, image_path):
+        # Decode, install the image item and paint the first frame. Background
+        # analysis builds are drained between repeats and measured separately.
+        window = self.window
+        samples = []
+        for _ in range(self.args.repeat):
+            window.thread_pool.waitForDone()
+            window.image_cache.clear()
+            start = time.perf_counter()
+            image = decode_image(image_path)
+            window.show_image(image_path, image, None)
+            window.image_viewer.viewport().repaint()
+            samples.append(time.perf_counter() - start)
+        return summarize(samples, image.width() * image.height())
+        
+    def bench_analysis(self, image_path):
+        # Histogram, colour index and region tables built after a load
+        window = self.window
+        window.thread_pool.waitForDone()
+        start = time.perf_counter()
+        window.reset_image_analysis()
+        window.selection_tool.setCurrentIndex(1)
+        window.thread_pool.waitForDone()
+        elapsed = time.perf_counter() - start
+        self.wait()
+        window.selection_tool.setCurrentIndex(0)
+        pixels = window.image_viewer.pixels
+        return summarize([elapsed], pixels.shape[0] * pixels.shape[1])
+        
+    def hover_stream(self, viewer):
+        # Mouse moves at random viewport positions; the frame timer is
+        # replaced by an explicit flush every few events, after which the
+        # event loop repaints just the regions the hover update dirtied
+        from PySide6.QtCore import QEvent, QPointF, Qt
+        from PySide6.QtGui import QMouseEvent
+        from PySide6.QtWidgets import QApplication
+        
+        viewport = viewer.viewport()
+        count = self.args.events
+        xs = self.rng.uniform(0, viewport.width() - 1, count)
+        ys = self.rng.uniform(0, viewport.height() - 1, count)
+        move_samples, frame_samples = [], []
+        for index in range(count):
+            pos = QPointF(xs[index], ys[index])
+            event = QMouseEvent(QEvent.MouseMove, pos, viewport.mapToGlobal(pos),
+                                Qt.NoButton, Qt.NoButton, Qt.NoModifier)
+            move_samples.append(timed(QApplication.sendEvent, viewport, event)[0])
+            if index % self.args.events_per_frame == self.args.events_per_frame - 1:
+                start = time.perf_counter()
+                viewer.flush_hover()
+                self.wait()
+                frame_samples.append(time.perf_counter() - start)
+        summary = summarize(frame_samples)
+        summary["move_event"] = summarize(move_samples)
+        return summary
+        
+    def bench_hover(self, image_path):
+        viewer = self.window.image_viewer
+        viewer.reset_zoom()
+        return self.hover_stream(viewer)
+        
+    def bench_hover_zoomed(self, image_path):
+        # Magnified far enough for the pixel grid and per-pixel labels
+        viewer = self.window.image_viewer
+        viewer.resetTransform()
+        viewer.scale(viewer.RGBA_LABEL_SCALE, viewer.RGBA_LABEL_SCALE)
+        viewer.centerOn(viewer.sceneRect().center())
+        summary = self.hover_stream(viewer)
+        viewer.reset_zoom()
+        return summary
+        
+    def bench_click(self, image_path):
+        # Press/release pairs that each add a pixel to the selection
+        from PySide6.QtCore import QEvent, QPointF, Qt
+        from PySide6.QtGui import QMouseEvent
+        from PySide6.QtWidgets import QApplication
+        
+        window = self.window
+        window.clear_all()
+        viewer = window.image_viewer
+        viewport = viewer.viewport()
+        image_rect = viewer.mapFromScene(viewer.sceneRect()).boundingRect().intersected(viewport.rect())
+        count = max(1, self.args.events // 4)
+        xs = self.rng.uniform(image_rect.left(), image_rect.right(), count)
+        ys = self.rng.uniform(image_rect.top(), image_rect.bottom(), count)
+        samples = []
+        for x, y in zip(xs, ys):
+            pos = QPointF(x, y)
+            press = QMouseEvent(QEvent.MouseButtonPress, pos, viewport.mapToGlobal(pos),
+                                Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+            release = QMouseEvent(QEvent.MouseButtonRelease, pos, viewport.mapToGlobal(pos),
+                                  Qt.LeftButton, Qt.NoButton, Qt.NoModifier)
+            start = time.perf_counter()
+            QApplication.sendEvent(viewport, press)
+            QApplication.sendEvent(viewport, release)
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+        
+    def set_red_filter(self, tolerance):
+        # Value 8 +/- tolerance on red keeps the selection to a few percent
+        window = self.window
+        window.filter_mode.setCurrentIndex(0)
+        window.r_check.setChecked(True)
+        window.r_filter.setValue(8)
+        window.r_tolerance.setValue(tolerance)
+        window.filter_timer.stop()
+        
+    def bench_filter_live(self, image_path):
+        # Alternate the tolerance so each evaluation recomputes its channel mask
+        window = self.window
+        pixels = window.image_viewer.pixels
+        samples = []
+        for index in range(self.args.repeat):
+            self.set_red_filter(8 + index % 2)
+            samples.append(timed(window.update_live_filter)[0])
+        return summarize(samples, len(samples) * pixels.shape[0] * pixels.shape[1])
+        
+    def bench_filter_expression(self, image_path):
+        expression = FilterExpression("r < 16 & abs(g - b) < 64 & luma > 32")
+        pixels = self.window.image_viewer.pixels
+        samples = [timed(expression.evaluate, pixels)[0] for _ in range(self.args.repeat)]
+        return summarize(samples, len(samples) * pixels.shape[0] * pixels.shape[1])
+        
+    def bench_select_matches(self, image_path):
+        window = self.window
+        self.set_red_filter(8)
+        window.update_live_filter()
+        samples = []
+        for _ in range(self.args.repeat):
+            window.clear_all()
+            samples.append(timed(window.select_filter_matches)[0])
+        return summarize(samples, len(samples) * len(window.selected_pixels))
+        
+    def bench_table_scroll(self, image_path):
+        # Jump to random rows of the selection table and repaint its viewport
+        table = self.window.pixels_table
+        model = self.window.pixels_model
+        rows = model.rowCount()
+        samples = []
+        for row in self.rng.integers(0, max(rows, 1), self.args.events // 4):
+            start = time.perf_counter()
+            table.scrollTo(model.index(int(row), 0))
+            table.viewport().repaint()
+            samples.append(time.perf_counter() - start)
+        summary = summarize(samples)
+        summary["rows"] = rows
+        return summary
+        
+    def bench_apply_filters(self, image_path):
+        # Prune a fresh selection of matches with a narrower red range
+        window = self.window
+        samples = []
+        for _ in range(self.args.repeat):
+            self.set_red_filter(8)
+            window.update_live_filter()
+            window.clear_all()
+            window.select_filter_matches()
+            rows = len(window.selected_pixels)
+            self.set_red_filter(4)
+            samples.append(timed(window.apply_filters)[0])
+        return summarize(samples, len(samples) * rows)
+        
+    def bench_export(self, extension):
+        store = self.window.selected_pixels
+        file_path = os.path.join(self.work_dir, f"bench_export{extension}")
+        samples = []
+        for _ in range(self.args.repeat):
+            chunks = lambda: iter_array_chunks(store.xs, store.ys, store.rgba)
+            samples.append(timed(export_pixels, file_path, chunks, len(store))[0])
+        summary = summarize(samples, len(samples) * len(store))
+        summary["file_bytes"] = os.path.getsize(file_path)
+        os.remove(file_path)
+        return summary
+        
+    def bench_export_csv(self, image_path):
+        return self.bench_export(".csv")
+        
+    def bench_export_npy(self, image_path):
+        return self.bench_export(".npy")
+        
+    def close(self):
+        self.window.thread_pool.waitForDone()
+        self.window.close()
+        self.wait()
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    import PySide6
+    return {
+        "revision": revision,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pyside": PySide6.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "qt_platform": os.environ.get("QT_QPA_PLATFORM"),
+    }
+
+
+def compare_results(baseline, results):
+    # p50 of each scenario against a previous run; ratios above 1 are slower
+    previous = {(entry["size_mp"], entry["scenario"]): entry for entry in baseline["results"]}
+    lines = [f"Compared with {baseline['environment'].get('revision') or 'baseline'}:"]
+    for entry in results:
+        old = previous.get((entry["size_mp"], entry["scenario"]))
+        if old is None or not old["p50_ms"]:
+            continue
+        ratio = entry["p50_ms"] / old["p50_ms"]
+        lines.append(
+            f"{entry['size_mp']:>6g} MP  {entry['scenario']:<18} p50 {old['p50_ms']:>10.3f} -> "
+            f"{entry['p50_ms']:>10.3f} ms  x{ratio:.2f}"
+        )
+    return "\n".join(lines)
+
+
+def run_benchmarks(argv):
+    parser = argparse.ArgumentParser(
+        prog="pixel_bench.py",
+        description="Benchmark the analyzer's hot paths offscreen on synthetic images."
+    )
+    parser.add_argument("--sizes", default="1,16",
+                        help="comma separated image sizes in megapixels (default: 1,16)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5, help="repeats of whole-image operations")
+    parser.add_argument("--events", type=int, default=2000, help="synthetic mouse moves per stream")
+    parser.add_argument("--events-per-frame", type=int, default=4,
+                        help="mouse moves coalesced into each painted frame")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--compare", metavar="JSON", help="print p50 ratios against an earlier run")
+    args = parser.parse_args(argv)
+    
+    try:
+        args.sizes = [float(size) for size in args.sizes.split(",")]
+    except ValueError:
+        parser.error(f"invalid --sizes: {args.sizes}")
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    if "load" not in args.scenarios:
+        # Every other scenario runs against the loaded image
+        args.scenarios.insert(0, "load")
+    args.repeat = max(1, args.repeat)
+    args.events_per_frame = max(1, args.events_per_frame)
+    
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    with tempfile.TemporaryDirectory(prefix="pixel_bench_") as work_dir:
+        run = BenchmarkRun(args, work_dir)
+        try:
+            for size in args.sizes:
+                run.run_size(size)
+        finally:
+            run.close()
+    
+    report = {"environment": environment(), "arguments": {
+        "sizes": args.sizes, "repeat": args.repeat, "events": args.events,
+        "events_per_frame": args.events_per_frame, "seed": args.seed,
+    }, "results": run.results}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as file:
+            print(compare_results(json.load(file), run.results), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_benchmarks(sys.argv[1:]))
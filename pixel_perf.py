@@ -0,0 +1,201 @@
+"""Hot-path timing instrumentation for PixelInspector-Pro.
+
+Operations are timed by decorating them with a recorder's timed(name), or by
+wrapping a block in span(name). Each operation keeps a rolling window of its
+latest durations for percentiles and a latency histogram, and with tracing on
+every call is also kept as a Chrome trace event:
+
+    PIXEL_PERF=1 python rgba_analyzer.py        # record timings
+    PIXEL_PERF=trace python rgba_analyzer.py    # ... and trace events
+
+PIXEL_PERF=0 (or false, off, no) leaves recording off.
+
+A disabled recorder costs one attribute check per decorated call. Nothing
+here imports Qt.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from collections import deque
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; only the RSS fallback uses it
+    resource = None
+
+
+# Histogram bins from 1 microsecond to 10 seconds, four per decade
+HISTOGRAM_EDGES = np.geomspace(1e-6, 10.0, 29)
+
+
+class _Series:
+    # Ring buffer of the latest durations of one operation, plus lifetime totals
+    def __init__(self, window):
+        self.durations = np.zeros(window, dtype=np.float64)
+        self.next = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        
+    def add(self, duration):
+        self.durations[self.next] = duration
+        self.next = (self.next + 1) % len(self.durations)
+        self.count += 1
+        self.total += duration
+        if duration > self.maximum:
+            self.maximum = duration
+            
+    def recent(self):
+        return self.durations[:min(self.count, len(self.durations))]
+
+
+class _Span:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+        
+    def __enter__(self):
+        if self.recorder.enabled:
+            self.start = time.perf_counter()
+        return self
+        
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.recorder.record(self.name, self.start, time.perf_counter() - self.start)
+            self.start = None
+        return False
+
+
+class PerfRecorder:
+    # Named operation latencies in rolling windows of `window` samples. With
+    # tracing on, (name, start, duration, thread) events are also kept, up to
+    # trace_capacity of the most recent ones. Recording takes a lock, so
+    # worker threads can report alongside the GUI thread.
+    def __init__(self, window=2048, trace_capacity=200000):
+        self.enabled = False
+        self.tracing = False
+        self.window = window
+        self.series = {}
+        self.trace = deque(maxlen=trace_capacity)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        
+    def enable(self, enabled=True, tracing=False):
+        self.enabled = enabled
+        self.tracing = enabled and tracing
+        
+    def record(self, name, start, duration):
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = _Series(self.window)
+            series.add(duration)
+            if self.tracing:
+                self.trace.append((name, start, duration, threading.get_ident()))
+                
+    def timed(self, name):
+        # Decorator timing every call of a function or method under name
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter() - start)
+            return wrapper
+        return decorate
+        
+    def span(self, name):
+        return _Span(self, name)
+        
+    def count(self, name):
+        series = self.series.get(name)
+        return 0 if series is None else series.count
+        
+    def summary(self, name):
+        # Percentiles over the rolling window; count and total over the lifetime
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                return None
+            recent = series.recent().copy()
+            count, total, maximum = series.count, series.total, series.maximum
+        p50, p90, p99 = np.percentile(recent, (50, 90, 99)) * 1000
+        return {
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total / count * 1000, 4),
+            "max_ms": round(maximum * 1000, 4),
+            "window": len(recent),
+            "p50_ms": round(float(p50), 4),
+            "p90_ms": round(float(p90), 4),
+            "p99_ms": round(float(p99), 4),
+            "histogram": np.histogram(recent, HISTOGRAM_EDGES)[0].tolist(),
+        }
+        
+    def snapshot(self):
+        return {name: self.summary(name) for name in sorted(self.series)}
+        
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.trace.clear()
+            
+    def dump_json(self, file_path):
+        report = {
+            "histogram_edges_ms": (HISTOGRAM_EDGES * 1000).round(6).tolist(),
+            "rss_bytes": current_rss_bytes(),
+            "operations": self.snapshot(),
+        }
+        with open(file_path, "w") as file:
+            json.dump(report, file, indent=2)
+            
+    def dump_chrome_trace(self, file_path):
+        # Complete ("X") events in microseconds, loadable in chrome://tracing
+        # and Perfetto
+        with self.lock:
+            events = list(self.trace)
+        pid = os.getpid()
+        trace = [
+            {"name": name, "cat": name.partition(".")[0], "ph": "X", "pid": pid, "tid": thread,
+             "ts": round((start - self.origin) * 1e6, 3), "dur": round(duration * 1e6, 3)}
+            for name, start, duration, thread in events
+        ]
+        with open(file_path, "w") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+
+def current_rss_bytes():
+    # Resident set size now on Linux; the peak elsewhere
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def parse_perf_setting(value):
+    # PIXEL_PERF value as (enabled, tracing): unset, empty, 0, false, off or
+    # no disable recording, trace also records trace events
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "off", "no"):
+        return False, False
+    return True, value == "trace"
+
+
+# Process-wide recorder used by the application's instrumented hot paths
+PERF = PerfRecorder()
+PERF.enable(*parse_perf_setting(os.environ.get("PIXEL_PERF")))
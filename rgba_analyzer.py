@@ -1,22 +1,595 @@
+import os
 import sys
-import csv
+import math
+import time
+import threading
+from collections import OrderedDict
 import numpy as np
+
+if __name__ == "__main__" and sys.argv[1:2] == ["batch"]:
+    # Headless batch runs dispatch before any Qt module is imported
+    from pixel_batch import run_batch
+    sys.exit(run_batch(sys.argv[2:]))
+
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTabWidget,
-    QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QLabel, QPushButton,
-    QSlider, QLineEdit, QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView,
+    QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QGraphicsItem,
+    QGraphicsRectItem, QGraphicsPathItem, QLabel, QPushButton,
+    QSlider, QLineEdit, QCheckBox, QTableWidget, QTableWidgetItem, QTableView, QHeaderView,
     QFileDialog, QMessageBox, QGroupBox, QGridLayout, QComboBox, QSpinBox,
-    QDoubleSpinBox, QStyle
+    QDoubleSpinBox, QStyle, QProgressBar, QDialog, QAbstractItemView, QInputDialog
 )
 from PySide6.QtGui import (
-    QPixmap, QImage, QPainter, QPen, QColor, QBrush, QFont, QIcon, QPalette,
-    QLinearGradient
+    QPixmap, QImage, QImageReader, QImageIOHandler, QPainter, QPainterPath, QPen, QColor, QFont,
+    QIcon, QPalette, QLinearGradient, QPolygonF
 )
-from PySide6.QtCore import Qt, QPoint, QSize, QRectF, QPointF, Signal
+from PySide6.QtCore import (
+    Qt, QPoint, QSize, QRectF, QPointF, QTimer, Signal, QAbstractTableModel, QModelIndex,
+    QObject, QRunnable, QThreadPool
+)
+
+from pixel_analysis import (
+    ImageCache, SelectionStore, ChannelMaskFilter, RegionStatistics, HistogramEngine, ColorIndex,
+    histogram_summary, color_palette, export_pixels, iter_array_chunks, iter_mask_chunks,
+    ExportCancelled, FilterExpression, ImageComparison, load_coordinates, sample_pixels,
+    mask_bounding_box, qimage_to_array, decode_image, native_format, nominal_range, auto_window,
+    tone_map, format_channel, list_frames, iter_frame_pixels, natural_sort_key, PixelTrace,
+    DiskCache, default_cache_dir, array_to_qimage
+)
+from pixel_perf import PERF, current_rss_bytes
+
+
+class ImageLoadSignals(QObject):
+    preview = Signal(int, QImage, QSize)
+    progress = Signal(int, int)
+    finished = Signal(int, QImage)
+    failed = Signal(int, str)
+
+
+class ImageLoadTask(QRunnable):
+    # Decodes an image on a thread pool worker. A downscaled preview is
+    # emitted first when the image is large, then the full-resolution image
+    # already converted to its native layout (RGBA8888, or RGBA64 / RGBA32FPx4
+    # for 16-bit and float sources). Every signal carries the load generation
+    # so that results of superseded loads can be ignored; cancel() also stops
+    # the task between stages. page selects a page of a multi-page file, and
+    # frame reads pass preview=False to skip the preview stage. source is the
+    # file's DiskCache.file_stamp, taken before decoding.
+    PREVIEW_SIZE = 1024
+    
+    def __init__(self, generation, image_path, page=0, preview=True):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.generation = generation
+        self.image_path = image_path
+        self.page = page
+        self.preview = preview
+        self.source = None
+        self.signals = ImageLoadSignals()
+        self.cancelled = threading.Event()
+        self.done = False
+        
+    def cancel(self):
+        self.cancelled.set()
+        
+    def run(self):
+        try:
+            self.load()
+        finally:
+            self.done = True
+            
+    @PERF.timed("load.decode")
+    def load(self):
+        try:
+            self.source = DiskCache.file_stamp(self.image_path)
+        except OSError:
+            pass
+        reader = QImageReader(self.image_path)
+        if self.page:
+            reader.jumpToImage(self.page)
+        size = reader.size()
+        preview_size = None
+        if self.preview and size.isValid() and max(size.width(), size.height()) > self.PREVIEW_SIZE:
+            preview_size = size.scaled(self.PREVIEW_SIZE, self.PREVIEW_SIZE, Qt.KeepAspectRatio)
+        self.signals.progress.emit(self.generation, 5)
+        
+        # Decoders that can scale while decoding (e.g. JPEG) give a cheap early
+        # preview; for the others it is derived from the decoded image below
+        if preview_size is not None and reader.supportsOption(QImageIOHandler.ScaledSize):
+            preview_reader = QImageReader(self.image_path)
+            if self.page:
+                preview_reader.jumpToImage(self.page)
+            preview_reader.setScaledSize(preview_size)
+            preview = preview_reader.read()
+            if self.cancelled.is_set():
+                return
+            if not preview.isNull():
+                self.signals.preview.emit(self.generation, preview, size)
+                preview_size = None
+        self.signals.progress.emit(self.generation, 30)
+        
+        image = reader.read()
+        if self.cancelled.is_set():
+            return
+        if image.isNull():
+            self.signals.failed.emit(self.generation, reader.errorString())
+            return
+        if preview_size is not None:
+            self.signals.preview.emit(
+                self.generation, image.scaled(preview_size, Qt.KeepAspectRatio), size
+            )
+        self.signals.progress.emit(self.generation, 80)
+        
+        image = image.convertToFormat(native_format(image))
+        if self.cancelled.is_set():
+            return
+        self.signals.progress.emit(self.generation, 100)
+        self.signals.finished.emit(self.generation, image)
+
+
+class AnalysisSignals(QObject):
+    finished = Signal(int, object)
+
+
+class AnalysisTask(QRunnable):
+    # Runs build(*args) on a thread pool worker, e.g. to precompute the
+    # RegionStatistics tables of an image; the generation lets results for
+    # a replaced image be ignored. With current(), returning the latest
+    # generation, a task superseded before it starts skips the build, so
+    # stepping through frames does not queue up work for every frame passed.
+    def __init__(self, generation, build, *args, current=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.generation = generation
+        self.build = build
+        self.args = args
+        self.current = current
+        self.signals = AnalysisSignals()
+        self.done = False
+        
+    def run(self):
+        try:
+            if self.current is None or self.current() == self.generation:
+                self.signals.finished.emit(self.generation, self.build(*self.args))
+        finally:
+            self.done = True
+
+
+class DiskCacheTask(QRunnable):
+    # Writes one artifact of an image to the on-disk cache on a thread pool
+    # worker. The arrays are not modified once built, so the GUI keeps using
+    # them meanwhile.
+    def __init__(self, cache, file_path, name, arrays, page=0, source=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.cache = cache
+        self.file_path = file_path
+        self.name = name
+        self.arrays = arrays
+        self.page = page
+        self.source = source
+        self.done = False
+        
+    @PERF.timed("disk_cache.write")
+    def run(self):
+        try:
+            self.cache.put(self.file_path, self.name, self.arrays, self.page, self.source)
+        finally:
+            self.done = True
+
+
+class ExportSignals(QObject):
+    progress = Signal(int)
+    finished = Signal(str, int)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class ExportTask(QRunnable):
+    # Streams pixel rows to a file with export_pixels on a thread pool worker,
+    # reporting whole-percent progress; cancel() stops it after the current chunk
+    def __init__(self, file_path, chunks, count, hex_column=True, channel_dtype=np.uint8):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.file_path = file_path
+        self.chunks = chunks
+        self.count = count
+        self.hex_column = hex_column
+        self.channel_dtype = channel_dtype
+        self.signals = ExportSignals()
+        self.cancelled = threading.Event()
+        self.percent = -1
+        self.done = False
+        
+    def cancel(self):
+        self.cancelled.set()
+        
+    def report(self, fraction):
+        percent = int(fraction * 100)
+        if percent != self.percent:
+            self.percent = percent
+            self.signals.progress.emit(percent)
+            
+    @PERF.timed("export.run")
+    def run(self):
+        try:
+            rows = export_pixels(self.file_path, self.chunks, self.count, self.hex_column,
+                                 progress=self.report, cancelled=self.cancelled.is_set,
+                                 channel_dtype=self.channel_dtype)
+        except ExportCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(self.file_path, rows)
+        finally:
+            self.done = True
+
+
+class TraceSignals(QObject):
+    progress = Signal(int, int)
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+
+class TraceTask(QRunnable):
+    # Decodes every frame in order on a thread pool worker and gathers the
+    # traced points from each into a PixelTrace; cancel() stops it between
+    # frames without emitting anything
+    def __init__(self, generation, frames, xs, ys):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.generation = generation
+        self.frames = frames
+        self.xs = xs
+        self.ys = ys
+        self.signals = TraceSignals()
+        self.cancelled = threading.Event()
+        self.done = False
+        
+    def cancel(self):
+        self.cancelled.set()
+        
+    @PERF.timed("frames.trace")
+    def run(self):
+        try:
+            trace = PixelTrace(self.xs, self.ys, len(self.frames))
+            percent = -1
+            for pixels in iter_frame_pixels(self.frames, native=True):
+                if self.cancelled.is_set():
+                    return
+                trace.add(pixels)
+                if trace.count * 100 // len(self.frames) != percent:
+                    percent = trace.count * 100 // len(self.frames)
+                    self.signals.progress.emit(self.generation, percent)
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+        else:
+            self.signals.finished.emit(self.generation, trace)
+        finally:
+            self.done = True
+
+
+# File dialog filter of every dialog that opens an image
+IMAGE_FILE_FILTER = "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)"
+
+# Images beyond these limits are rendered through TiledImageItem
+TILED_MAX_SIDE = 8192
+TILED_MAX_PIXELS = 16 * 1024 * 1024
+
+# Frames read ahead of the stepping direction, and behind it
+FRAME_PREFETCH_AHEAD = 4
+FRAME_PREFETCH_BEHIND = 1
+# Largest pixel trace kept in memory
+TRACE_MAX_BYTES = 512 * 1024 * 1024
+# Derived data restored from the disk cache, by artifact name
+DISK_CACHE_DERIVED = {"histogram": HistogramEngine, "color_index": ColorIndex, "region_stats": RegionStatistics}
+
+
+@PERF.timed("pixmap.upload")
+def pixmap_from_image(image):
+    return QPixmap.fromImage(image)
+
+
+class TiledImageItem(QGraphicsItem):
+    # Renders an image from a lazily built level-of-detail pyramid. Level n
+    # samples every 2**n-th source pixel, so a tile always holds at most
+    # TILE_SIZE x TILE_SIZE pixels whatever the zoom. Only tiles intersecting
+    # the exposed area are uploaded as pixmaps; the least recently used ones
+    # are evicted once the cache grows past memory_budget bytes. 16-bit and
+    # float pixels are tone mapped through the display window as each tile is
+    # built, so a window change only drops the cached tiles.
+    TILE_SIZE = 512
+    
+    def __init__(self, pixels, memory_budget=256 * 1024 * 1024, window=None, parent=None):
+        super().__init__(parent)
+        self.pixels = pixels
+        self.memory_budget = memory_budget
+        self.window = window or nominal_range(pixels.dtype)
+        self.tile_cache = OrderedDict()
+        self.cache_bytes = 0
+        
+        height, width = pixels.shape[:2]
+        self.bounds = QRectF(0, 0, width, height)
+        self.max_level = max(0, math.ceil(math.log2(max(width, height) / self.TILE_SIZE)))
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        
+    def boundingRect(self):
+        return self.bounds
+        
+    def level_for_scale(self, scale):
+        if scale >= 1.0:
+            return 0
+        return min(self.max_level, int(math.log2(1.0 / scale)))
+        
+    def tile_pixmap(self, level, col, row):
+        key = (level, col, row)
+        pixmap = self.tile_cache.get(key)
+        if pixmap is not None:
+            self.tile_cache.move_to_end(key)
+            return pixmap
+            
+        step = 1 << level
+        span = self.TILE_SIZE * step
+        y0, x0 = row * span, col * span
+        tile = tone_map(self.pixels[y0:y0 + span:step, x0:x0 + span:step], *self.window)
+        height, width = tile.shape[:2]
+        image = QImage(tile.data, width, height, tile.strides[0], QImage.Format_RGBA8888)
+        pixmap = pixmap_from_image(image)
+        
+        self.tile_cache[key] = pixmap
+        self.cache_bytes += width * height * 4
+        return pixmap
+        
+    def evict(self, keep):
+        for key in list(self.tile_cache):
+            if self.cache_bytes <= self.memory_budget:
+                break
+            if key in keep:
+                continue
+            pixmap = self.tile_cache.pop(key)
+            self.cache_bytes -= pixmap.width() * pixmap.height() * 4
+            
+    def clear_cache(self):
+        self.tile_cache.clear()
+        self.cache_bytes = 0
+        
+    def set_window(self, low, high):
+        self.window = (low, high)
+        self.clear_cache()
+        self.update()
+        
+    @PERF.timed("tiles.paint")
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self.bounds)
+        if exposed.isEmpty():
+            return
+            
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.level_for_scale(scale)
+        step = 1 << level
+        span = self.TILE_SIZE * step
+        width, height = self.bounds.width(), self.bounds.height()
+        
+        col_first = int(exposed.left()) // span
+        col_last = (math.ceil(exposed.right()) - 1) // span
+        row_first = int(exposed.top()) // span
+        row_last = (math.ceil(exposed.bottom()) - 1) // span
+        
+        visible = set()
+        for row in range(row_first, row_last + 1):
+            for col in range(col_first, col_last + 1):
+                pixmap = self.tile_pixmap(level, col, row)
+                visible.add((level, col, row))
+                
+                # Edge tiles may reach past the image; clip to the real extent
+                x0, y0 = col * span, row * span
+                target_w = min(pixmap.width() * step, width - x0)
+                target_h = min(pixmap.height() * step, height - y0)
+                painter.drawPixmap(
+                    QRectF(x0, y0, target_w, target_h),
+                    pixmap,
+                    QRectF(0, 0, target_w / step, target_h / step)
+                )
+                
+        self.evict(visible)
+
+
+def difference_color_table():
+    # Indexed8 colours for a difference map: 0 is transparent, larger errors
+    # run from translucent red to opaque yellow
+    return [0] + [
+        (min(255, 90 + level * 165 // 255) << 24) | (255 << 16) | (level << 8)
+        for level in range(1, 256)
+    ]
+
+
+class MaskOverlayItem(QGraphicsItem):
+    # Semi-transparent overlay of a boolean image mask, or of a uint8 map
+    # drawn through a colour table. Each paint samples the exposed part of the
+    # mask at roughly screen resolution into a one-byte indexed image, so the
+    # cost follows the viewport rather than the image.
+    def __init__(self, bounds, color_table=None, parent=None):
+        super().__init__(parent)
+        self.bounds = bounds
+        self.mask = None
+        self.color = QColor(255, 0, 255, 110)
+        self.color_table = color_table
+        self.setZValue(5)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        
+    def boundingRect(self):
+        return self.bounds
+        
+    def set_mask(self, mask):
+        self.mask = mask
+        self.update()
+        
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self.bounds)
+        if self.mask is None or exposed.isEmpty():
+            return
+            
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        step = 1 if scale >= 1.0 else 1 << int(math.log2(1.0 / scale))
+        left = math.floor(exposed.left()) // step * step
+        top = math.floor(exposed.top()) // step * step
+        right, bottom = math.ceil(exposed.right()), math.ceil(exposed.bottom())
+        
+        sample = np.ascontiguousarray(self.mask[top:bottom:step, left:right:step]).view(np.uint8)
+        height, width = sample.shape
+        if height == 0 or width == 0:
+            return
+        image = QImage(sample.data, width, height, width, QImage.Format_Indexed8)
+        image.setColorTable(self.color_table or [0, self.color.rgba()])
+        painter.drawImage(
+            QRectF(left, top, min(width * step, self.bounds.width() - left),
+                   min(height * step, self.bounds.height() - top)),
+            image,
+            QRectF(0, 0, width, height)
+        )
+
+
+class SelectionMarkersItem(QGraphicsItem):
+    # Paints every persistent selection marker straight from the coordinate
+    # columns of a SelectionStore in a single item. Only markers inside the
+    # exposed rect are considered; when there are too many to outline
+    # individually they are rasterized into a one-byte mask image at screen
+    # resolution and drawn in one call.
+    MAX_OUTLINED = 4096
+    
+    def __init__(self, bounds, store=None, parent=None):
+        super().__init__(parent)
+        self.bounds = bounds
+        self.store = store
+        self.color = QColor(255, 210, 0)
+        self.pen = QPen(self.color, 0)
+        self.setZValue(9)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        
+    def boundingRect(self):
+        return self.bounds
+        
+    def markers_added(self, xs, ys):
+        if len(xs) == 1:
+            self.update(QRectF(int(xs[0]) - 1, int(ys[0]) - 1, 3, 3))
+        else:
+            self.update()
+            
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self.bounds)
+        if not self.store or exposed.isEmpty():
+            return
+            
+        left, top = math.floor(exposed.left()), math.floor(exposed.top())
+        right, bottom = math.ceil(exposed.right()), math.ceil(exposed.bottom())
+        xs, ys = self.store.xs, self.store.ys
+        inside = (xs >= left) & (xs < right) & (ys >= top) & (ys < bottom)
+        xs, ys = xs[inside], ys[inside]
+        if len(xs) == 0:
+            return
+            
+        if len(xs) <= self.MAX_OUTLINED:
+            painter.setPen(self.pen)
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRects([QRectF(x, y, 1, 1) for x, y in zip(xs.tolist(), ys.tolist())])
+            return
+            
+        # One mask cell per screen pixel (or per image pixel when zoomed in)
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        cell = max(1.0, 1.0 / scale)
+        mask_w = max(1, math.ceil((right - left) / cell))
+        mask_h = max(1, math.ceil((bottom - top) / cell))
+        stride = (mask_w + 3) & ~3
+        mask = np.zeros((mask_h, stride), dtype=np.uint8)
+        mask[((ys - top) / cell).astype(np.intp), ((xs - left) / cell).astype(np.intp)] = 1
+        
+        image = QImage(mask.data, mask_w, mask_h, stride, QImage.Format_Indexed8)
+        image.setColorTable([0, self.color.rgba()])
+        painter.drawImage(QRectF(left, top, mask_w * cell, mask_h * cell), image)
+
+
+class PixelMarkerOverlay:
+    # Owns the marker items of an ImageViewer. The hover and selected markers
+    # are created once and moved in place; persistent selection markers are
+    # batched in a SelectionMarkersItem. Items are rebuilt by attach() whenever
+    # the scene is cleared for a new image.
+    def __init__(self):
+        self.selected_item = None
+        self.hover_item = None
+        self.selection_item = None
+        self.region_rect_item = None
+        self.region_path_item = None
+        
+    def attach(self, scene, bounds, store):
+        self.selected_item = QGraphicsRectItem(QRectF(-5, -5, 10, 10))
+        self.selected_item.setPen(QPen(Qt.white, 1.5))
+        self.hover_item = QGraphicsRectItem(QRectF(-2.5, -2.5, 5, 5))
+        self.hover_item.setPen(QPen(Qt.red, 1))
+        for item in (self.selected_item, self.hover_item):
+            item.setZValue(10)
+            item.setVisible(False)
+            scene.addItem(item)
+            
+        self.selection_item = SelectionMarkersItem(bounds, store)
+        scene.addItem(self.selection_item)
+        
+        # Region outlines keep a one pixel screen width at any zoom
+        region_pen = QPen(QColor(255, 220, 0), 1, Qt.DashLine)
+        region_pen.setCosmetic(True)
+        self.region_rect_item = QGraphicsRectItem()
+        self.region_path_item = QGraphicsPathItem()
+        for item in (self.region_rect_item, self.region_path_item):
+            item.setPen(region_pen)
+            item.setZValue(11)
+            item.setVisible(False)
+            scene.addItem(item)
+            
+    def move_marker(self, item, pixel):
+        if item is None:
+            return
+        if pixel is None:
+            item.setVisible(False)
+            return
+        item.setPos(pixel[0], pixel[1])
+        item.setVisible(True)
+        
+    def update_markers(self, selected_pixel, hover_pixel):
+        self.move_marker(self.selected_item, selected_pixel)
+        self.move_marker(self.hover_item, hover_pixel)
+        
+    def show_region(self, rect=None, points=None):
+        # rect is (left, top, right, bottom) in pixels, points a lasso outline
+        if self.region_rect_item is None:
+            return
+        if rect is not None:
+            left, top, right, bottom = rect
+            self.region_rect_item.setRect(QRectF(left, top, right - left, bottom - top))
+        self.region_rect_item.setVisible(rect is not None)
+        if points is not None:
+            path = QPainterPath()
+            path.addPolygon(QPolygonF([QPointF(x, y) for x, y in points]))
+            path.closeSubpath()
+            self.region_path_item.setPath(path)
+        self.region_path_item.setVisible(points is not None)
+
 
 class ImageViewer(QGraphicsView):
     pixelSelected = Signal(int, int, QColor)
     pixelHovered = Signal(int, int, QColor)
+    # Half-open pixel rectangle, emitted while dragging and on release
+    rectangleChanged = Signal(int, int, int, int)
+    # (n, 2) array of lasso points in pixel coordinates, emitted on release
+    polygonSelected = Signal(object)
+    # The visible part of the image changed through scrolling or zooming
+    viewChanged = Signal()
+    
+    # Screen pixels per image pixel above which pixels are drawn as hard
+    # blocks, outlined by a grid, and labelled with hex or RGBA values
+    NEAREST_SCALE = 2.0
+    GRID_SCALE = 8.0
+    HEX_LABEL_SCALE = 52.0
+    RGBA_LABEL_SCALE = 64.0
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -31,35 +604,176 @@ class ImageViewer(QGraphicsView):
         
         self.pixmap_item = None
         self.image = None
+        self.pixels = None
+        self.pixmap = None
+        # (low, high) channel values shown as black and white
+        self.display_window = None
         self.zoom_factor = 1.0
         self.selected_pixel = None
         self.hover_pixel = None
         self.hover_enabled = True
+        self.markers = PixelMarkerOverlay()
+        self.selection = None
+        self.mask_item = None
+        self.overlay_mask = None
+        self.difference_item = None
+        self.difference_map = None
+        
+        # Grid lines and labels are built for a padded range around the
+        # viewport and reused until a paint reaches outside it
+        self.pixel_grid_enabled = True
+        self.grid_cache = None
+        self.label_font = QFont("Monospace", 8)
+        self.label_font.setStyleHint(QFont.TypeWriter)
+        
+        # Hover moves are coalesced: the latest position is kept and handled
+        # at most once per display frame by flush_hover
+        self.pending_hover = None
+        self.hover_events = 0
+        self.hover_updates = 0
+        self.hover_timer = QTimer(self)
+        self.hover_timer.setSingleShot(True)
+        self.hover_timer.setInterval(self.frame_interval())
+        self.hover_timer.timeout.connect(self.flush_hover)
+        
+        # Tiled rendering is used automatically for images too large to hold
+        # comfortably in a single pixmap, or always when force_tiles is set
+        self.force_tiles = False
+        self.tile_memory_budget = 256 * 1024 * 1024
+        
+        # Region tools: "pixel" picks single pixels, "rectangle" and "lasso"
+        # drag out a region. Drag updates share the hover frame timer.
+        self.selection_mode = "pixel"
+        self.region_origin = None
+        self.region_points = None
+        self.region_rect = None
+        self.pending_region = False
         
         # Setup custom cursor
         self.setCursor(Qt.CrossCursor)
         
     def load_image(self, image_path):
-        self.image = QImage(image_path)
-        if self.image.isNull():
+        image = decode_image(image_path, native=True)
+        if image is None:
             return False
-            
-        self.pixmap = QPixmap.fromImage(self.image)
+        self.set_image(image)
+        return True
+        
+    @PERF.timed("load.install")
+    def set_image(self, image, reset_view=True):
+        # image must already be in a native array layout (RGBA8888, RGBA64 or
+        # RGBA32FPx4) so every pixel read is plain array indexing
+        self.image = image
+        self.pixels = qimage_to_array(self.image)
+        if self.pixels.dtype.kind == "f":
+            self.display_window = auto_window(self.pixels)
+        else:
+            self.display_window = nominal_range(self.pixels.dtype)
+        self.install_image_item()
+        
+        # Reset view; a kept view (e.g. the next frame of a stack) keeps the
+        # selected and hovered pixel too
+        if reset_view:
+            self.zoom_factor = 1.0
+            self.resetTransform()
+            self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
+            self.selected_pixel = None
+            self.hover_pixel = None
+        self.cancel_region()
+        
+    def show_preview(self, preview, full_size):
+        # Display a downscaled stand-in stretched to the full image extent.
+        # Picking is disabled until set_image installs the real pixels.
+        self.image = None
+        self.pixels = None
+        self.pixmap = pixmap_from_image(preview)
         if self.pixmap_item:
             self.scene.removeItem(self.pixmap_item)
-            
         self.pixmap_item = QGraphicsPixmapItem(self.pixmap)
+        self.pixmap_item.setScale(full_size.width() / max(1, preview.width()))
+        
         self.scene.clear()
         self.scene.addItem(self.pixmap_item)
-        self.setSceneRect(QRectF(self.pixmap.rect()))
+        self.markers = PixelMarkerOverlay()
+        self.mask_item = None
+        self.difference_item = None
+        self.grid_cache = None
+        self.setSceneRect(QRectF(0, 0, full_size.width(), full_size.height()))
         
-        # Reset view
         self.zoom_factor = 1.0
         self.resetTransform()
         self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         self.selected_pixel = None
         self.hover_pixel = None
-        return True
+        self.cancel_region()
+        
+    def clear_image(self):
+        self.image = None
+        self.pixels = None
+        self.pixmap = None
+        self.pixmap_item = None
+        self.scene.clear()
+        self.markers = PixelMarkerOverlay()
+        self.mask_item = None
+        self.difference_item = None
+        self.grid_cache = None
+        self.selected_pixel = None
+        self.hover_pixel = None
+        self.cancel_region()
+        
+    def high_depth(self):
+        return self.pixels is not None and self.pixels.dtype != np.uint8
+        
+    def use_tiles(self):
+        # High-depth images are always tiled: tiles are where they are tone mapped
+        width, height = self.image.width(), self.image.height()
+        return (self.force_tiles or self.high_depth() or width > TILED_MAX_SIDE
+                or height > TILED_MAX_SIDE or width * height > TILED_MAX_PIXELS)
+        
+    def install_image_item(self):
+        if self.pixmap_item:
+            self.scene.removeItem(self.pixmap_item)
+            
+        if self.use_tiles():
+            self.pixmap = None
+            self.pixmap_item = TiledImageItem(self.pixels, self.tile_memory_budget, self.display_window)
+        else:
+            self.pixmap = pixmap_from_image(self.image)
+            self.pixmap_item = QGraphicsPixmapItem(self.pixmap)
+            
+        self.scene.clear()
+        self.scene.addItem(self.pixmap_item)
+        self.setSceneRect(self.pixmap_item.boundingRect())
+        self.markers.attach(self.scene, self.pixmap_item.boundingRect(), self.selection)
+        self.mask_item = None
+        self.difference_item = None
+        self.grid_cache = None
+        self.set_mask_overlay(self.overlay_mask)
+        self.set_difference_overlay(self.difference_map)
+        
+    def set_force_tiles(self, enabled):
+        self.force_tiles = enabled
+        if self.image is not None:
+            self.install_image_item()
+            self.draw_pixel_markers()
+            
+    def set_display_window(self, low, high):
+        self.display_window = (low, high)
+        if isinstance(self.pixmap_item, TiledImageItem):
+            self.pixmap_item.set_window(low, high)
+        self.grid_cache = None
+        self.viewport().update()
+        
+    def pixel_rgba(self, x, y):
+        # Native channel values: ints for 8 and 16-bit images, floats for float ones
+        r, g, b, a = self.pixels[y, x].tolist()
+        return r, g, b, a
+        
+    def pixel_color(self, x, y):
+        # Displayed colour; high-depth values go through the display window
+        if self.pixels.dtype == np.uint8:
+            return QColor(*self.pixel_rgba(x, y))
+        return QColor(*tone_map(self.pixels[y, x], *self.display_window).tolist())
         
     def wheelEvent(self, event):
         zoom_in_factor = 1.25
@@ -82,9 +796,32 @@ class ImageViewer(QGraphicsView):
         # Move scene to old position
         delta = new_pos - old_pos
         self.translate(delta.x(), delta.y())
+        self.viewChanged.emit()
+        
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.viewChanged.emit()
+        
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.viewChanged.emit()
+        
+    def visible_rect(self):
+        # Half-open pixel rectangle of the image shown in the viewport
+        if self.image is None:
+            return None
+        area = self.mapToScene(self.viewport().rect()).boundingRect()
+        return (max(0, math.floor(area.left())), max(0, math.floor(area.top())),
+                min(self.image.width(), math.ceil(area.right())),
+                min(self.image.height(), math.ceil(area.bottom())))
         
     def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton and self.pixmap_item:
+        if self.selection_mode != "pixel":
+            if event.button() == Qt.LeftButton and self.pixels is not None:
+                self.start_region(self.image_point(event))
+            return
+            
+        if event.button() == Qt.LeftButton and self.pixmap_item and self.pixels is not None:
             scene_pos = self.mapToScene(event.pos())
             if self.pixmap_item.contains(scene_pos):
                 pixel_pos = self.pixmap_item.mapFromScene(scene_pos)
@@ -94,14 +831,26 @@ class ImageViewer(QGraphicsView):
                 # Ensure we're within image bounds
                 if 0 <= x < self.image.width() and 0 <= y < self.image.height():
                     self.selected_pixel = (x, y)
-                    color = self.image.pixelColor(x, y)
+                    color = self.pixel_color(x, y)
                     self.pixelSelected.emit(x, y, color)
                     self.draw_pixel_markers()
                     
         super().mousePressEvent(event)
         
     def mouseMoveEvent(self, event):
-        if self.pixmap_item and self.hover_enabled:
+        if self.region_origin is not None:
+            point = self.image_point(event)
+            if self.region_points is not None:
+                self.region_points.append(point)
+                self.pending_region = True
+            else:
+                rect = self.rect_between(self.region_origin, point)
+                self.pending_region = self.pending_region or rect != self.region_rect
+                self.region_rect = rect
+            if self.pending_region and not self.hover_timer.isActive():
+                self.hover_timer.start()
+                
+        if self.pixmap_item and self.hover_enabled and self.pixels is not None:
             scene_pos = self.mapToScene(event.pos())
             if self.pixmap_item.contains(scene_pos):
                 pixel_pos = self.pixmap_item.mapFromScene(scene_pos)
@@ -110,38 +859,255 @@ class ImageViewer(QGraphicsView):
                 
                 # Ensure we're within image bounds
                 if 0 <= x < self.image.width() and 0 <= y < self.image.height():
-                    self.hover_pixel = (x, y)
-                    color = self.image.pixelColor(x, y)
-                    self.pixelHovered.emit(x, y, color)
-                    self.draw_pixel_markers()
+                    self.hover_events += 1
+                    self.pending_hover = (x, y)
+                    if not self.hover_timer.isActive():
+                        self.hover_timer.start()
                     
         super().mouseMoveEvent(event)
         
-    def draw_pixel_markers(self):
-        if not self.image:
+    def mouseReleaseEvent(self, event):
+        if self.region_origin is not None and event.button() == Qt.LeftButton:
+            self.flush_region()
+            if self.region_points is not None and len(self.region_points) >= 3:
+                self.polygonSelected.emit(np.array(self.region_points, dtype=np.float64))
+            self.region_origin = None
+            return
+        super().mouseReleaseEvent(event)
+        
+    @PERF.timed("viewer.paint")
+    def paintEvent(self, event):
+        # Smoothing blurs pixel boundaries once pixels are magnified, and is
+        # the expensive path for large magnified pixmaps
+        smooth = self.transform().m11() < self.NEAREST_SCALE
+        if bool(self.renderHints() & QPainter.SmoothPixmapTransform) != smooth:
+            self.setRenderHint(QPainter.SmoothPixmapTransform, smooth)
+            self.setRenderHint(QPainter.Antialiasing, smooth)
+        super().paintEvent(event)
+        
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        scale = self.transform().m11()
+        if not self.pixel_grid_enabled or self.pixels is None or scale < self.GRID_SCALE:
+            return
+        exposed = rect.intersected(self.sceneRect())
+        if exposed.isEmpty():
             return
+        left, top = math.floor(exposed.left()), math.floor(exposed.top())
+        right, bottom = math.ceil(exposed.right()), math.ceil(exposed.bottom())
+        
+        # 16-bit and float values have no short hex form, so they only get value labels
+        hex_labels = scale >= self.HEX_LABEL_SCALE and not self.high_depth()
+        labels = "rgba" if scale >= self.RGBA_LABEL_SCALE else "hex" if hex_labels else None
+        cache = self.grid_cache
+        if (cache is None or cache["labels"] != labels or left < cache["left"] or top < cache["top"]
+                or right > cache["right"] or bottom > cache["bottom"]):
+            cache = self.grid_cache = self.build_grid_cache(labels)
+        left, top = max(left, cache["left"]), max(top, cache["top"])
+        right, bottom = min(right, cache["right"]), min(bottom, cache["bottom"])
+        
+        painter.save()
+        pen = QPen(QColor(128, 128, 128, 160), 0)
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        painter.drawPath(cache["path"])
+        if labels is not None:
+            self.draw_pixel_labels(painter, cache, left, top, right, bottom)
+        painter.restore()
+        
+    def build_grid_cache(self, labels):
+        # Covers the viewport plus half a viewport on each side, so panning
+        # rebuilds it only occasionally
+        left, top, right, bottom = self.visible_rect()
+        pad_x, pad_y = (right - left) // 2 + 1, (bottom - top) // 2 + 1
+        height, width = self.pixels.shape[:2]
+        left, top = max(0, left - pad_x), max(0, top - pad_y)
+        right, bottom = min(width, right + pad_x), min(height, bottom + pad_y)
+        
+        path = QPainterPath()
+        for x in range(left, right + 1):
+            path.moveTo(x, top)
+            path.lineTo(x, bottom)
+        for y in range(top, bottom + 1):
+            path.moveTo(left, y)
+            path.lineTo(right, y)
             
-        # Clear previous markers
-        for item in self.scene.items():
-            if isinstance(item, QGraphicsRectItem):
-                self.scene.removeItem(item)
+        cache = {"left": left, "top": top, "right": right, "bottom": bottom,
+                 "labels": labels, "path": path, "text": None, "dark": None}
+        if labels is not None:
+            values = self.pixels[top:bottom, left:right]
+            rows = values.reshape(-1, 4).tolist()
+            if labels == "hex":
+                text = [f"#{r:02x}{g:02x}{b:02x}" for r, g, b, a in rows]
+            elif values.dtype.kind == "f":
+                text = [f"{r:.4g}\n{g:.4g}\n{b:.4g}\n{a:.4g}" for r, g, b, a in rows]
+            else:
+                text = [f"{r}\n{g}\n{b}\n{a}" for r, g, b, a in rows]
+            cache["text"] = text
+            # Light text on dark pixels, dark text on light ones, as displayed
+            if values.dtype != np.uint8:
+                values = tone_map(values, *self.display_window)
+            luma = values[..., 0] * 0.299 + values[..., 1] * 0.587 + values[..., 2] * 0.114
+            cache["dark"] = (luma < 128).ravel().tolist()
+        return cache
+        
+    def draw_pixel_labels(self, painter, cache, left, top, right, bottom):
+        # Only cells inside the exposed rect are labelled; text is drawn in
+        # device coordinates so it keeps its size at any zoom. Cells are
+        # grouped by text colour so the pen changes at most twice.
+        transform = painter.worldTransform()
+        painter.resetTransform()
+        painter.setFont(self.label_font)
+        stride = cache["right"] - cache["left"]
+        text, dark = cache["text"], cache["dark"]
+        cells = ([], [])
+        for y in range(top, bottom):
+            row = (y - cache["top"]) * stride - cache["left"]
+            for x in range(left, right):
+                cells[dark[row + x]].append((x, y, row + x))
+        for color, shade_cells in zip((Qt.black, Qt.white), cells):
+            if not shade_cells:
+                continue
+            painter.setPen(QPen(color))
+            for x, y, index in shade_cells:
+                painter.drawText(transform.mapRect(QRectF(x, y, 1, 1)), Qt.AlignCenter, text[index])
+                
+    def set_pixel_grid_enabled(self, enabled):
+        self.pixel_grid_enabled = enabled
+        self.viewport().update()
+        
+    def image_point(self, event):
+        # Scene position of the event clamped to the image, in pixel units
+        pos = self.mapToScene(event.pos())
+        return (min(max(pos.x(), 0.0), float(self.image.width())),
+                min(max(pos.y(), 0.0), float(self.image.height())))
                 
-        # Draw selected pixel marker
-        if self.selected_pixel:
-            x, y = self.selected_pixel
-            rect = QRectF(x - 5, y - 5, 10, 10)
-            marker = self.scene.addRect(rect, QPen(Qt.white, 1.5), QBrush(Qt.NoBrush))
-            marker.setZValue(10)
-            
-        # Draw hover pixel marker
-        if self.hover_pixel:
-            x, y = self.hover_pixel
-            rect = QRectF(x - 2.5, y - 2.5, 5, 5)
-            marker = self.scene.addRect(rect, QPen(Qt.red, 1), QBrush(Qt.NoBrush))
-            marker.setZValue(10)
+    def rect_between(self, start, end):
+        # Half-open rectangle covering every pixel touched between two points
+        width, height = self.image.width(), self.image.height()
+        left = min(int(min(start[0], end[0])), width - 1)
+        top = min(int(min(start[1], end[1])), height - 1)
+        right = min(int(max(start[0], end[0])) + 1, width)
+        bottom = min(int(max(start[1], end[1])) + 1, height)
+        return left, top, right, bottom
+        
+    def set_selection_mode(self, mode):
+        self.selection_mode = mode
+        self.setDragMode(QGraphicsView.ScrollHandDrag if mode == "pixel" else QGraphicsView.NoDrag)
+        self.cancel_region()
+        
+    def start_region(self, point):
+        self.region_origin = point
+        self.region_points = [point] if self.selection_mode == "lasso" else None
+        self.region_rect = None if self.region_points is not None else self.rect_between(point, point)
+        self.pending_region = True
+        self.flush_region()
+        
+    def cancel_region(self):
+        self.region_origin = None
+        self.region_points = None
+        self.region_rect = None
+        self.pending_region = False
+        self.markers.show_region()
+        
+    def flush_region(self):
+        if not self.pending_region:
+            return
+        self.pending_region = False
+        if self.region_points is not None:
+            self.markers.show_region(points=self.region_points)
+        elif self.region_rect is not None:
+            self.markers.show_region(rect=self.region_rect)
+            self.rectangleChanged.emit(*self.region_rect)
+            
+    def frame_interval(self):
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen else 0
+        return max(1, int(1000 / (refresh_rate if refresh_rate > 0 else 60)))
+        
+    def flush_hover(self):
+        self.flush_region()
+        pixel, self.pending_hover = self.pending_hover, None
+        if pixel is None or pixel == self.hover_pixel or self.pixels is None:
+            return
+            
+        self.hover_updates += 1
+        self.hover_pixel = pixel
+        x, y = pixel
+        self.pixelHovered.emit(x, y, self.pixel_color(x, y))
+        self.draw_pixel_markers()
+        
+    def mirror_hover(self, x, y):
+        # Show the hover marker for a position hovered in a linked viewer
+        if self.pixels is None or self.hover_pixel == (x, y):
+            return
+        self.hover_pixel = (x, y)
+        self.draw_pixel_markers()
+        
+    def hover_stats(self):
+        return {
+            "events": self.hover_events,
+            "processed": self.hover_updates,
+            "dropped": self.hover_events - self.hover_updates,
+        }
+        
+    @PERF.timed("viewer.markers")
+    def draw_pixel_markers(self):
+        if self.image is None:
+            return
+        self.markers.update_markers(self.selected_pixel, self.hover_pixel)
+        
+    def set_mask_overlay(self, mask):
+        if mask is not None and (self.pixels is None or mask.shape != self.pixels.shape[:2]):
+            mask = None
+        self.overlay_mask = mask
+        if self.mask_item is None:
+            if mask is None:
+                return
+            self.mask_item = MaskOverlayItem(self.pixmap_item.boundingRect())
+            self.scene.addItem(self.mask_item)
+        self.mask_item.set_mask(mask)
+        
+    def set_difference_overlay(self, difference):
+        # uint8 difference map drawn below the filter mask through a heat
+        # colour table; like the mask it is sampled per paint, never converted
+        # to a full-size pixmap
+        if difference is not None and (self.pixels is None or difference.shape != self.pixels.shape[:2]):
+            difference = None
+        self.difference_map = difference
+        if self.difference_item is None:
+            if difference is None:
+                return
+            self.difference_item = MaskOverlayItem(self.pixmap_item.boundingRect(), difference_color_table())
+            self.difference_item.setZValue(4)
+            self.scene.addItem(self.difference_item)
+        self.difference_item.set_mask(difference)
+        
+    def follow_view(self, other):
+        # Match the zoom and centre of another viewer showing the same extent
+        self.setTransform(other.transform())
+        self.zoom_factor = other.zoom_factor
+        self.centerOn(other.mapToScene(other.viewport().rect().center()))
+        
+    def set_selection_store(self, store):
+        self.selection = store
+        if self.markers.selection_item is not None:
+            self.markers.selection_item.store = store
+            self.markers.selection_item.update()
+            
+    def add_selection_markers(self, xs, ys):
+        if self.markers.selection_item is not None:
+            self.markers.selection_item.markers_added(xs, ys)
+            
+    def refresh_selection_markers(self):
+        if self.markers.selection_item is not None:
+            self.markers.selection_item.update()
             
     def set_hover_enabled(self, enabled):
         self.hover_enabled = enabled
+        if not enabled:
+            self.hover_timer.stop()
+            self.pending_hover = None
         if not enabled and self.hover_pixel:
             self.hover_pixel = None
             self.draw_pixel_markers()
@@ -149,21 +1115,478 @@ class ImageViewer(QGraphicsView):
     def zoom_in(self):
         self.scale(1.25, 1.25)
         self.zoom_factor *= 1.25
+        self.viewChanged.emit()
         
     def zoom_out(self):
         self.scale(0.8, 0.8)
         self.zoom_factor *= 0.8
+        self.viewChanged.emit()
         
     def reset_zoom(self):
         self.resetTransform()
         self.zoom_factor = 1.0
         self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
+        self.viewChanged.emit()
         
     def clear_selection(self):
         self.selected_pixel = None
+        self.refresh_selection_markers()
         self.draw_pixel_markers()
 
 
+class SelectedPixelsModel(QAbstractTableModel):
+    # Read-only table model over a SelectionStore. Cells are produced on demand
+    # for the rows a view actually shows, appends are announced as row
+    # insertions and any other change as a model reset.
+    HEADERS = ["X", "Y", "R", "G", "B", "A"]
+    
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.rows = len(store)
+        self.version = store.version
+        # Window that high-depth row colours are tone mapped through
+        self.display_window = None
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return str(self.store.xs[row])
+            if column == 1:
+                return str(self.store.ys[row])
+            return str(self.store.rgba[row, column - 2])
+        if role == Qt.BackgroundRole:
+            rgba = self.store.rgba[row]
+            if rgba.dtype != np.uint8:
+                rgba = tone_map(rgba, *(self.display_window or nominal_range(rgba.dtype)))
+            return QColor(*rgba.tolist())
+        return None
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+        
+    def set_display_window(self, window):
+        self.display_window = window
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rows - 1, len(self.HEADERS) - 1),
+                                  [Qt.BackgroundRole])
+            
+    def sync(self):
+        count = len(self.store)
+        if self.store.version == self.version and count > self.rows:
+            self.beginInsertRows(QModelIndex(), self.rows, count - 1)
+            self.rows = count
+            self.endInsertRows()
+        elif self.store.version != self.version or count != self.rows:
+            self.beginResetModel()
+            self.rows = count
+            self.version = self.store.version
+            self.endResetModel()
+
+
+class ColorSwatch(QWidget):
+    # Colour preview painted directly, so changing the colour costs a repaint
+    # instead of a style sheet parse and re-polish
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.color = QColor(Qt.black)
+        self.border_color = QColor("#555")
+        
+    def set_color(self, color):
+        if color != self.color:
+            self.color = QColor(color)
+            self.update()
+            
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.color)
+        painter.setPen(self.border_color)
+        painter.drawRect(self.rect().adjusted(0, 0, -1, -1))
+
+
+class HistogramWidget(QWidget):
+    # Per-channel histogram plot. Curves use a square-root scale so sparse
+    # bins stay visible; their paths are rebuilt only when the histograms or
+    # the widget size change, so repaints never touch the counts.
+    CHANNEL_COLORS = (QColor(255, 80, 80, 110), QColor(80, 220, 80, 110),
+                      QColor(90, 130, 255, 110), QColor(220, 220, 220))
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.histograms = None
+        self.paths = None
+        self.setMinimumHeight(120)
+        
+    def set_histograms(self, histograms):
+        self.histograms = histograms
+        self.paths = None
+        self.update()
+        
+    def resizeEvent(self, event):
+        self.paths = None
+        super().resizeEvent(event)
+        
+    def build_paths(self):
+        width, height = self.width() - 2, self.height() - 2
+        xs = np.linspace(1, width + 1, 256)
+        # Alpha is usually one spike at 255, so it is scaled on its own
+        color_peak = max(1, int(self.histograms[:3].max()))
+        alpha_peak = max(1, int(self.histograms[3].max()))
+        self.paths = []
+        for channel, hist in enumerate(self.histograms):
+            peak = alpha_peak if channel == 3 else color_peak
+            ys = height + 1 - np.sqrt(hist / peak) * height
+            points = [QPointF(1, height + 1)] + [QPointF(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+            points.append(QPointF(width + 1, height + 1))
+            path = QPainterPath()
+            path.addPolygon(QPolygonF(points))
+            self.paths.append(path)
+            
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(20, 20, 32))
+        if self.histograms is not None:
+            if self.paths is None:
+                self.build_paths()
+            painter.setRenderHint(QPainter.Antialiasing)
+            for channel, path in enumerate(self.paths):
+                color = self.CHANNEL_COLORS[channel]
+                if channel == 3:
+                    painter.setPen(QPen(color, 1, Qt.DotLine))
+                    painter.setBrush(Qt.NoBrush)
+                else:
+                    painter.setPen(Qt.NoPen)
+                    painter.setBrush(color)
+                painter.drawPath(path)
+        painter.setPen(QColor("#555"))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(self.rect().adjusted(0, 0, -1, -1))
+
+
+class PerfOverlay(QLabel):
+    # Readout floating over an image viewer: frame times and rate, hover
+    # event rates, memory and the operations that took the most time.
+    # Refreshed twice a second while shown.
+    TOP_OPERATIONS = 8
+    
+    def __init__(self, viewer, recorder=PERF):
+        super().__init__(viewer)
+        self.viewer = viewer
+        self.recorder = recorder
+        self.previous = None
+        font = QFont("Monospace", 8)
+        font.setStyleHint(QFont.TypeWriter)
+        self.setFont(font)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 180); color: #7CFC00; padding: 6px;")
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.move(8, 8)
+        self.timer = QTimer(self)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.refresh)
+        
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.previous = None
+        self.refresh()
+        self.timer.start()
+        
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+        
+    def refresh(self):
+        now = time.perf_counter()
+        counts = (self.recorder.count("viewer.paint"), self.viewer.hover_events, self.viewer.hover_updates)
+        rates = (0.0, 0.0, 0.0)
+        if self.previous is not None:
+            elapsed = max(now - self.previous[0], 1e-6)
+            rates = tuple((count - before) / elapsed for count, before in zip(counts, self.previous[1]))
+        self.previous = (now, counts)
+        
+        frame = self.recorder.summary("viewer.paint")
+        lines = [
+            f"Frame  p50 {frame['p50_ms']:6.2f} ms  p99 {frame['p99_ms']:6.2f} ms  {rates[0]:5.1f}/s"
+            if frame else "Frame  no paints recorded",
+            f"Hover  {rates[1]:6.0f} events/s  {rates[2]:5.0f} updates/s",
+        ]
+        rss = current_rss_bytes()
+        if rss is not None:
+            lines.append(f"RSS    {rss / 1048576:8.1f} MB")
+            
+        operations = [(name, stats) for name, stats in self.recorder.snapshot().items() if stats]
+        operations.sort(key=lambda item: item[1]["total_ms"], reverse=True)
+        if operations:
+            lines.append(f"{'operation':<16} {'calls':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, stats in operations[:self.TOP_OPERATIONS]:
+            lines.append(f"{name:<16} {stats['count']:>7} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+
+
+class PaletteDialog(QDialog):
+    # Most frequent colours of the image from color_palette(). Clicking a row
+    # emits its RGBA value so the owner can select those pixels.
+    colorActivated = Signal(object)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Colour Palette")
+        self.resize(520, 600)
+        layout = QVBoxLayout(self)
+        
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["Colour", "Hex", "RGBA", "Pixels", "Share"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        layout.addWidget(self.table)
+        self.colors = None
+        
+        self.table.cellClicked.connect(self.handle_cell_clicked)
+        
+    def set_palette(self, palette):
+        self.colors = palette["colors"]
+        self.summary_label.setText(
+            f"{palette['unique']:,} distinct colours in {palette['pixels']:,} pixels\n"
+            f"Strategy: {palette['strategy']}  Time: {palette['seconds'] * 1000:.0f} ms  "
+            f"Memory: {palette['memory_bytes'] / 1048576:.1f} MB"
+        )
+        
+        self.table.setRowCount(len(self.colors))
+        for row, ((r, g, b, a), count) in enumerate(zip(self.colors.tolist(), palette["counts"].tolist())):
+            swatch = QTableWidgetItem()
+            swatch.setBackground(QColor(r, g, b))
+            self.table.setItem(row, 0, swatch)
+            self.table.setItem(row, 1, QTableWidgetItem(f"#{r:02x}{g:02x}{b:02x}"))
+            self.table.setItem(row, 2, QTableWidgetItem(f"{r}, {g}, {b}, {a}"))
+            self.table.setItem(row, 3, QTableWidgetItem(f"{count:,}"))
+            self.table.setItem(row, 4, QTableWidgetItem(f"{count / palette['pixels'] * 100:.2f}%"))
+            
+    def handle_cell_clicked(self, row, column):
+        self.colorActivated.emit(self.colors[row])
+
+
+class TracePlot(QWidget):
+    # Channel values of one pixel over the frames, with the current frame
+    # marked. Like HistogramWidget it rebuilds its paths only when the series
+    # or the size changes. Clicking picks the frame under the cursor.
+    frameClicked = Signal(int)
+    CHANNEL_COLORS = (QColor(255, 80, 80), QColor(80, 220, 80), QColor(90, 130, 255), QColor(220, 220, 220))
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.series = None
+        self.paths = None
+        self.frame = 0
+        self.setMinimumHeight(200)
+        
+    def set_series(self, series):
+        self.series = series
+        self.paths = None
+        self.update()
+        
+    def set_frame(self, frame):
+        self.frame = frame
+        self.update()
+        
+    def resizeEvent(self, event):
+        self.paths = None
+        super().resizeEvent(event)
+        
+    def frame_x(self, frame):
+        return 1 + frame * (self.width() - 3) / max(len(self.series) - 1, 1)
+        
+    def build_paths(self):
+        values = self.series.astype(np.float64)
+        finite = np.isfinite(values)
+        low = float(values[finite].min()) if finite.any() else 0.0
+        high = float(values[finite].max()) if finite.any() else 1.0
+        height = self.height() - 3
+        xs = [self.frame_x(frame) for frame in range(len(values))]
+        ys = 1 + height - (np.where(finite, values, low) - low) / max(high - low, 1e-12) * height
+        self.paths = []
+        for channel in range(4):
+            path = QPainterPath()
+            path.addPolygon(QPolygonF([QPointF(x, y) for x, y in zip(xs, ys[:, channel].tolist())]))
+            self.paths.append(path)
+            
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(20, 20, 32))
+        if self.series is not None and len(self.series):
+            if self.paths is None:
+                self.build_paths()
+            painter.setRenderHint(QPainter.Antialiasing)
+            for channel, path in enumerate(self.paths):
+                painter.setPen(QPen(self.CHANNEL_COLORS[channel], 1, Qt.DotLine if channel == 3 else Qt.SolidLine))
+                painter.drawPath(path)
+            painter.setPen(QPen(QColor(255, 255, 255, 120), 1))
+            x = self.frame_x(self.frame)
+            painter.drawLine(QPointF(x, 0), QPointF(x, self.height()))
+        painter.setPen(QColor("#555"))
+        painter.drawRect(self.rect().adjusted(0, 0, -1, -1))
+        
+    def mousePressEvent(self, event):
+        if self.series is not None and len(self.series) and event.button() == Qt.LeftButton:
+            frame = round((event.position().x() - 1) / max(self.width() - 3, 1) * (len(self.series) - 1))
+            self.frameClicked.emit(min(max(frame, 0), len(self.series) - 1))
+            
+            
+class TraceDialog(QDialog):
+    # Pixel-through-time plot of a PixelTrace. One traced point is shown at a
+    # time; clicking the plot emits the frame so the owner can step to it.
+    frameActivated = Signal(int)
+    # Points offered in the chooser; the saved trace holds all of them
+    MAX_LISTED_POINTS = 1000
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Pixel Through Time")
+        self.resize(640, 420)
+        layout = QVBoxLayout(self)
+        
+        self.point_combo = QComboBox()
+        layout.addWidget(self.point_combo)
+        self.plot = TracePlot()
+        layout.addWidget(self.plot, 1)
+        self.stats_label = QLabel()
+        stats_font = QFont("Monospace")
+        stats_font.setStyleHint(QFont.TypeWriter)
+        self.stats_label.setFont(stats_font)
+        layout.addWidget(self.stats_label)
+        self.save_btn = QPushButton("Save Trace...")
+        layout.addWidget(self.save_btn)
+        self.trace = None
+        
+        self.point_combo.currentIndexChanged.connect(self.show_point)
+        self.plot.frameClicked.connect(self.frameActivated)
+        self.save_btn.clicked.connect(self.save_trace)
+        
+    def set_trace(self, trace, frame):
+        self.trace = trace
+        self.plot.set_frame(frame)
+        self.point_combo.blockSignals(True)
+        self.point_combo.clear()
+        listed = min(len(trace.xs), self.MAX_LISTED_POINTS)
+        self.point_combo.addItems([f"({x}, {y})" for x, y in zip(trace.xs[:listed].tolist(), trace.ys[:listed].tolist())])
+        self.point_combo.blockSignals(False)
+        self.show_point(0)
+        
+    def set_frame(self, frame):
+        self.plot.set_frame(frame)
+        
+    def show_point(self, point):
+        if self.trace is None or point < 0:
+            return
+        series = self.trace.series(point)
+        valid = self.trace.valid[:self.trace.count, point]
+        self.plot.set_series(series)
+        lines = [f"{self.trace.count} frames, {len(self.trace.xs):,} points traced"
+                 + (f", outside {np.count_nonzero(~valid)} frames" if not valid.all() else ""),
+                 "         Min        Max       Mean"]
+        values = series[valid].astype(np.float64)
+        for channel, name in enumerate("RGBA"):
+            if not len(values):
+                break
+            column = values[:, channel]
+            lines.append(f"{name}  {column.min():10.6g} {column.max():10.6g} {column.mean():10.6g}")
+        self.stats_label.setText("\n".join(lines))
+        
+    def save_trace(self):
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Save Trace", "trace.npz", "NumPy Archive (*.npz);;CSV Files (*.csv)"
+        )
+        if not file_path:
+            return
+        if not file_path.lower().endswith((".npz", ".csv")):
+            file_path += selected_filter[selected_filter.index("*") + 1:-1]
+        try:
+            self.trace.save(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to save trace: {str(e)}")
+
+
+DARK_STYLESHEET = """
+    QTabWidget::pane {
+        border: 1px solid #444;
+        background: #1a1a2a;
+    }
+    QTabBar::tab {
+        background: #252540;
+        color: #ddd;
+        padding: 8px;
+        border: 1px solid #444;
+        border-bottom: none;
+        border-top-left-radius: 4px;
+        border-top-right-radius: 4px;
+    }
+    QTabBar::tab:selected {
+        background: #3a3a60;
+        color: #fff;
+    }
+    QGroupBox {
+        border: 1px solid #444;
+        border-radius: 5px;
+        margin-top: 1ex;
+        font-weight: bold;
+    }
+    QGroupBox::title {
+        subcontrol-origin: margin;
+        left: 10px;
+        padding: 0 3px 0 3px;
+    }
+    QTableView {
+        background: #1a1a2a;
+        gridline-color: #444;
+        border: 1px solid #444;
+    }
+    QHeaderView::section {
+        background-color: #252540;
+        color: #ddd;
+        padding: 4px;
+        border: 1px solid #444;
+    }
+    QPushButton {
+        background: #3a3a60;
+        color: #fff;
+        border: 1px solid #555;
+        padding: 5px;
+        border-radius: 4px;
+    }
+    QPushButton:hover {
+        background: #4a4a80;
+    }
+    QPushButton:pressed {
+        background: #2a2a40;
+    }
+    QLineEdit, QSpinBox, QDoubleSpinBox, QComboBox {
+        background: #1a1a2a;
+        color: #fff;
+        border: 1px solid #555;
+        padding: 3px;
+        border-radius: 3px;
+    }
+    QLabel {
+        color: #ddd;
+    }
+"""
+
+
 class RGBAnalyzer(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -187,14 +1610,123 @@ class RGBAnalyzer(QMainWindow):
         self.tabs.addTab(self.main_tab, "RGBA Analyzer")
         self.setup_main_tab()
         
-        # Create developer tab
+        # Create developer tab; its contents are built on first view
         self.dev_tab = QWidget()
+        self.dev_tab_ready = False
         self.tabs.addTab(self.dev_tab, "About Developer")
-        self.setup_dev_tab()
+        self.tabs.currentChanged.connect(self.handle_tab_changed)
         
         # Current image path
         self.image_path = None
-        self.selected_pixels = []
+        self.selected_pixels = SelectionStore()
+        self.image_viewer.set_selection_store(self.selected_pixels)
+        self.pixels_model = SelectedPixelsModel(self.selected_pixels, self)
+        self.pixels_table.setModel(self.pixels_model)
+        
+        # Background image loading
+        self.thread_pool = QThreadPool.globalInstance()
+        self.load_task = None
+        self.load_generation = 0
+        self.previous_image = None
+        self.preview_shown = False
+        # Started tasks stay referenced until their run() has returned
+        self.running_load_tasks = []
+        
+        # Recently decoded images and their derived data; reopening one of
+        # them skips decoding and the background analysis builds
+        self.image_cache = ImageCache()
+        self.image_entry = None
+        self.previous_entry = None
+        # Opened images and their derived data also persist on disk, so they
+        # reopen from memory-mapped files after a restart
+        self.disk_cache = DiskCache(default_cache_dir())
+        self.running_disk_tasks = []
+        self.setup_status_bar()
+        
+        # Region statistics tables are built in the background the first time
+        # a region tool is used on an image
+        self.region_stats = None
+        self.region_generation = 0
+        self.region_task = None
+        self.pending_region = None
+        self.running_analysis_tasks = []
+        
+        # Histograms come from a HistogramEngine whose tile cache is filled in
+        # the background after each load; later views are sums of cached tiles
+        self.histogram_engine = None
+        self.histogram_generation = 0
+        self.histogram_timer = QTimer(self)
+        self.histogram_timer.setSingleShot(True)
+        self.histogram_timer.setInterval(100)
+        self.histogram_timer.timeout.connect(self.update_histogram)
+        
+        # Colour lookups use a ColorIndex built in the background after each
+        # load, unless its worst-case size exceeds the budget
+        self.color_index = None
+        self.color_index_generation = 0
+        self.color_index_budget = 1024 * 1024 * 1024
+        # Palettes are extracted in the background on request
+        self.palette_dialog = None
+        self.palette_generation = 0
+        self.palette_task = None
+        self.perf_overlay = None
+        
+        # Comparison image: loaded like the main image but kept in its own
+        # viewer; metrics come from an ImageComparison built in the background.
+        # The load and the metrics have separate generations, so a new main
+        # image or frame does not drop a comparison image still loading.
+        self.compare_task = None
+        self.compare_load_generation = 0
+        self.compare_generation = 0
+        self.comparison = None
+        self.syncing_views = False
+        
+        # Frames of the open multi-page file or image sequence as (path, page).
+        # Stepping reads frames through frame_cache; read-ahead tasks, keyed by
+        # a serial number, fill it around the current frame in the direction
+        # of travel.
+        self.frames = []
+        self.pending_frames = None
+        self.frame_index = 0
+        self.frame_direction = 1
+        self.frame_cache = ImageCache(512 * 1024 * 1024)
+        self.prefetch_tasks = {}
+        self.prefetch_serial = 0
+        self.waiting_frame = None
+        self.trace_task = None
+        self.trace_generation = 0
+        self.trace_dialog = None
+        
+        # Menus are not needed for the first frame; build them right after it
+        QTimer.singleShot(0, self.create_menu)
+        
+    def handle_tab_changed(self, index):
+        if self.tabs.widget(index) is self.dev_tab and not self.dev_tab_ready:
+            self.dev_tab_ready = True
+            self.setup_dev_tab()
+            
+    def setup_status_bar(self):
+        self.load_progress = QProgressBar()
+        self.load_progress.setRange(0, 100)
+        self.load_progress.setMaximumWidth(200)
+        self.load_cancel_btn = QPushButton("Cancel")
+        self.load_cancel_btn.clicked.connect(self.cancel_loading)
+        self.statusBar().addPermanentWidget(self.load_progress)
+        self.statusBar().addPermanentWidget(self.load_cancel_btn)
+        self.load_progress.hide()
+        self.load_cancel_btn.hide()
+        
+        self.export_task = None
+        self.export_progress = QProgressBar()
+        self.export_progress.setRange(0, 100)
+        self.export_progress.setMaximumWidth(200)
+        self.export_progress.setFormat("Export %p%")
+        self.export_cancel_btn = QPushButton("Cancel Export")
+        self.export_cancel_btn.clicked.connect(self.cancel_export)
+        self.statusBar().addPermanentWidget(self.export_progress)
+        self.statusBar().addPermanentWidget(self.export_cancel_btn)
+        self.export_progress.hide()
+        self.export_cancel_btn.hide()
         
     def set_dark_theme(self):
         # Create a dark palette
@@ -217,70 +1749,7 @@ class RGBAnalyzer(QMainWindow):
         QApplication.setPalette(dark_palette)
         
         # Set style
-        self.setStyleSheet("""
-            QTabWidget::pane {
-                border: 1px solid #444;
-                background: #1a1a2a;
-            }
-            QTabBar::tab {
-                background: #252540;
-                color: #ddd;
-                padding: 8px;
-                border: 1px solid #444;
-                border-bottom: none;
-                border-top-left-radius: 4px;
-                border-top-right-radius: 4px;
-            }
-            QTabBar::tab:selected {
-                background: #3a3a60;
-                color: #fff;
-            }
-            QGroupBox {
-                border: 1px solid #444;
-                border-radius: 5px;
-                margin-top: 1ex;
-                font-weight: bold;
-            }
-            QGroupBox::title {
-                subcontrol-origin: margin;
-                left: 10px;
-                padding: 0 3px 0 3px;
-            }
-            QTableWidget {
-                background: #1a1a2a;
-                gridline-color: #444;
-                border: 1px solid #444;
-            }
-            QHeaderView::section {
-                background-color: #252540;
-                color: #ddd;
-                padding: 4px;
-                border: 1px solid #444;
-            }
-            QPushButton {
-                background: #3a3a60;
-                color: #fff;
-                border: 1px solid #555;
-                padding: 5px;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background: #4a4a80;
-            }
-            QPushButton:pressed {
-                background: #2a2a40;
-            }
-            QLineEdit, QSpinBox, QDoubleSpinBox, QComboBox {
-                background: #1a1a2a;
-                color: #fff;
-                border: 1px solid #555;
-                padding: 3px;
-                border-radius: 3px;
-            }
-            QLabel {
-                color: #ddd;
-            }
-        """)
+        self.setStyleSheet(DARK_STYLESHEET)
         
     def setup_main_tab(self):
         layout = QHBoxLayout(self.main_tab)
@@ -288,9 +1757,34 @@ class RGBAnalyzer(QMainWindow):
         # Left side - Image viewer and controls
         left_panel = QVBoxLayout()
         
-        # Image viewer
+        # Image viewer, with a second viewer beside it while comparing
+        viewer_layout = QHBoxLayout()
         self.image_viewer = ImageViewer()
-        left_panel.addWidget(self.image_viewer, 3)
+        self.compare_viewer = ImageViewer()
+        self.compare_viewer.hide()
+        viewer_layout.addWidget(self.image_viewer)
+        viewer_layout.addWidget(self.compare_viewer)
+        left_panel.addLayout(viewer_layout, 3)
+        
+        # Frame navigation, shown for multi-page files and image sequences
+        self.frame_bar = QWidget()
+        frame_layout = QHBoxLayout(self.frame_bar)
+        frame_layout.setContentsMargins(0, 0, 0, 0)
+        self.prev_frame_btn = QPushButton()
+        self.prev_frame_btn.setIcon(self.style().standardIcon(QStyle.SP_MediaSeekBackward))
+        self.next_frame_btn = QPushButton()
+        self.next_frame_btn.setIcon(self.style().standardIcon(QStyle.SP_MediaSeekForward))
+        self.frame_slider = QSlider(Qt.Horizontal)
+        self.frame_label = QLabel("Frame 1 / 1")
+        self.trace_btn = QPushButton("Pixel Through Time...")
+        
+        frame_layout.addWidget(self.prev_frame_btn)
+        frame_layout.addWidget(self.frame_slider, 1)
+        frame_layout.addWidget(self.next_frame_btn)
+        frame_layout.addWidget(self.frame_label)
+        frame_layout.addWidget(self.trace_btn)
+        self.frame_bar.hide()
+        left_panel.addWidget(self.frame_bar)
         
         # Controls
         controls_layout = QHBoxLayout()
@@ -314,14 +1808,37 @@ class RGBAnalyzer(QMainWindow):
         select_layout = QHBoxLayout(select_group)
         self.clear_btn = QPushButton("Clear Selection")
         self.clear_btn.setIcon(self.style().standardIcon(QStyle.SP_TrashIcon))
-        self.export_btn = QPushButton("Export to CSV")
+        self.dedupe_btn = QPushButton("Remove Duplicates")
+        self.export_btn = QPushButton("Export...")
         self.export_btn.setIcon(self.style().standardIcon(QStyle.SP_DialogSaveButton))
         
         select_layout.addWidget(self.clear_btn)
+        select_layout.addWidget(self.dedupe_btn)
         select_layout.addWidget(self.export_btn)
         
+        # Display window of 16-bit and float images: the channel values shown
+        # as black and white. Readouts and filters keep using the true values.
+        self.display_group = QGroupBox("Display Window")
+        display_layout = QHBoxLayout(self.display_group)
+        self.window_low = QDoubleSpinBox()
+        self.window_high = QDoubleSpinBox()
+        for spin in (self.window_low, self.window_high):
+            spin.setRange(-1e9, 1e9)
+            spin.setDecimals(4)
+        self.window_auto_btn = QPushButton("Auto")
+        self.window_full_btn = QPushButton("Full Range")
+        
+        display_layout.addWidget(QLabel("Black:"))
+        display_layout.addWidget(self.window_low)
+        display_layout.addWidget(QLabel("White:"))
+        display_layout.addWidget(self.window_high)
+        display_layout.addWidget(self.window_auto_btn)
+        display_layout.addWidget(self.window_full_btn)
+        self.display_group.hide()
+        
         controls_layout.addWidget(zoom_group)
         controls_layout.addWidget(select_group)
+        controls_layout.addWidget(self.display_group)
         
         left_panel.addLayout(controls_layout)
         
@@ -335,9 +1852,8 @@ class RGBAnalyzer(QMainWindow):
         self.pos_label = QLabel("Position: N/A")
         self.rgba_label = QLabel("RGBA: N/A")
         self.hex_label = QLabel("Hex: N/A")
-        self.color_preview = QLabel()
+        self.color_preview = ColorSwatch()
         self.color_preview.setMinimumSize(80, 80)
-        self.color_preview.setStyleSheet("background-color: black; border: 1px solid #555;")
         
         info_layout.addWidget(QLabel("Position:"), 0, 0)
         info_layout.addWidget(self.pos_label, 0, 1)
@@ -347,6 +1863,31 @@ class RGBAnalyzer(QMainWindow):
         info_layout.addWidget(self.hex_label, 2, 1)
         info_layout.addWidget(self.color_preview, 0, 2, 3, 1)
         
+        info_layout.addWidget(QLabel("Tolerance:"), 3, 0)
+        self.find_tolerance = QDoubleSpinBox()
+        self.find_tolerance.setDecimals(0)
+        self.find_tolerance.setRange(0, 255)
+        info_layout.addWidget(self.find_tolerance, 3, 1)
+        self.find_color_btn = QPushButton("Find This Colour")
+        info_layout.addWidget(self.find_color_btn, 3, 2)
+        
+        # Histogram
+        histogram_group = QGroupBox("Histogram")
+        histogram_layout = QGridLayout(histogram_group)
+        
+        histogram_layout.addWidget(QLabel("Source:"), 0, 0)
+        self.histogram_source = QComboBox()
+        self.histogram_source.addItems(["Whole Image", "Visible Region", "Filter Matches"])
+        histogram_layout.addWidget(self.histogram_source, 0, 1)
+        
+        self.histogram_view = HistogramWidget()
+        histogram_layout.addWidget(self.histogram_view, 1, 0, 1, 2)
+        self.histogram_label = QLabel("No image")
+        histogram_font = QFont("Monospace")
+        histogram_font.setStyleHint(QFont.TypeWriter)
+        self.histogram_label.setFont(histogram_font)
+        histogram_layout.addWidget(self.histogram_label, 2, 0, 1, 2)
+        
         # Manual selection
         manual_group = QGroupBox("Manual Selection")
         manual_layout = QGridLayout(manual_group)
@@ -363,60 +1904,173 @@ class RGBAnalyzer(QMainWindow):
         
         self.select_btn = QPushButton("Select Pixel")
         manual_layout.addWidget(self.select_btn, 2, 0, 1, 2)
+        self.import_coords_btn = QPushButton("Import Coordinates...")
+        manual_layout.addWidget(self.import_coords_btn, 3, 0, 1, 2)
+        
+        # Region statistics
+        region_group = QGroupBox("Region Statistics")
+        region_layout = QGridLayout(region_group)
+        
+        region_layout.addWidget(QLabel("Tool:"), 0, 0)
+        self.selection_tool = QComboBox()
+        self.selection_tool.addItems(["Pixel", "Rectangle", "Lasso"])
+        region_layout.addWidget(self.selection_tool, 0, 1)
+        
+        self.region_label = QLabel("Drag a rectangle or lasso to measure a region")
+        region_font = QFont("Monospace")
+        region_font.setStyleHint(QFont.TypeWriter)
+        self.region_label.setFont(region_font)
+        region_layout.addWidget(self.region_label, 1, 0, 1, 2)
         
         # Filters
         filter_group = QGroupBox("Pixel Filters")
         filter_layout = QGridLayout(filter_group)
         
-        filter_layout.addWidget(QLabel("R:"), 0, 0)
-        self.r_filter = QSpinBox()
+        self.filter_mode = QComboBox()
+        self.filter_mode.addItems(["Value \u00b1 Tolerance", "Min / Max Range"])
+        filter_layout.addWidget(QLabel("Mode:"), 0, 0)
+        filter_layout.addWidget(self.filter_mode, 0, 1, 1, 3)
+        
+        self.filter_low_header = QLabel("Value")
+        self.filter_high_header = QLabel("\u00b1")
+        filter_layout.addWidget(self.filter_low_header, 1, 1)
+        filter_layout.addWidget(self.filter_high_header, 1, 2)
+        
+        filter_layout.addWidget(QLabel("R:"), 2, 0)
+        self.r_filter = QDoubleSpinBox()
+        self.r_filter.setDecimals(0)
         self.r_filter.setRange(0, 255)
         self.r_filter.setValue(255)
-        filter_layout.addWidget(self.r_filter, 0, 1)
+        filter_layout.addWidget(self.r_filter, 2, 1)
+        self.r_tolerance = QDoubleSpinBox()
+        self.r_tolerance.setDecimals(0)
+        self.r_tolerance.setRange(0, 255)
+        filter_layout.addWidget(self.r_tolerance, 2, 2)
         self.r_check = QCheckBox("Enable")
         self.r_check.setChecked(False)
-        filter_layout.addWidget(self.r_check, 0, 2)
+        filter_layout.addWidget(self.r_check, 2, 3)
         
-        filter_layout.addWidget(QLabel("G:"), 1, 0)
-        self.g_filter = QSpinBox()
+        filter_layout.addWidget(QLabel("G:"), 3, 0)
+        self.g_filter = QDoubleSpinBox()
+        self.g_filter.setDecimals(0)
         self.g_filter.setRange(0, 255)
         self.g_filter.setValue(255)
-        filter_layout.addWidget(self.g_filter, 1, 1)
+        filter_layout.addWidget(self.g_filter, 3, 1)
+        self.g_tolerance = QDoubleSpinBox()
+        self.g_tolerance.setDecimals(0)
+        self.g_tolerance.setRange(0, 255)
+        filter_layout.addWidget(self.g_tolerance, 3, 2)
         self.g_check = QCheckBox("Enable")
         self.g_check.setChecked(False)
-        filter_layout.addWidget(self.g_check, 1, 2)
+        filter_layout.addWidget(self.g_check, 3, 3)
         
-        filter_layout.addWidget(QLabel("B:"), 2, 0)
-        self.b_filter = QSpinBox()
+        filter_layout.addWidget(QLabel("B:"), 4, 0)
+        self.b_filter = QDoubleSpinBox()
+        self.b_filter.setDecimals(0)
         self.b_filter.setRange(0, 255)
         self.b_filter.setValue(255)
-        filter_layout.addWidget(self.b_filter, 2, 1)
+        filter_layout.addWidget(self.b_filter, 4, 1)
+        self.b_tolerance = QDoubleSpinBox()
+        self.b_tolerance.setDecimals(0)
+        self.b_tolerance.setRange(0, 255)
+        filter_layout.addWidget(self.b_tolerance, 4, 2)
         self.b_check = QCheckBox("Enable")
         self.b_check.setChecked(False)
-        filter_layout.addWidget(self.b_check, 2, 2)
+        filter_layout.addWidget(self.b_check, 4, 3)
         
-        filter_layout.addWidget(QLabel("A:"), 3, 0)
-        self.a_filter = QSpinBox()
+        filter_layout.addWidget(QLabel("A:"), 5, 0)
+        self.a_filter = QDoubleSpinBox()
+        self.a_filter.setDecimals(0)
         self.a_filter.setRange(0, 255)
         self.a_filter.setValue(255)
-        filter_layout.addWidget(self.a_filter, 3, 1)
+        filter_layout.addWidget(self.a_filter, 5, 1)
+        self.a_tolerance = QDoubleSpinBox()
+        self.a_tolerance.setDecimals(0)
+        self.a_tolerance.setRange(0, 255)
+        filter_layout.addWidget(self.a_tolerance, 5, 2)
         self.a_check = QCheckBox("Enable")
         self.a_check.setChecked(False)
-        filter_layout.addWidget(self.a_check, 3, 2)
+        filter_layout.addWidget(self.a_check, 5, 3)
+        
+        filter_layout.addWidget(QLabel("Expr:"), 6, 0)
+        self.filter_expression_input = QLineEdit()
+        self.filter_expression_input.setPlaceholderText("e.g. r > 200 & a < 128, abs(g - b) < 5, luma > 128")
+        self.filter_expression_input.setToolTip(
+            "Names: r, g, b, a, luma, x, y. Functions: abs, min, max.\n"
+            "Operators: | or, & and, ~ not, < <= > >= == !=, + - * / %"
+        )
+        filter_layout.addWidget(self.filter_expression_input, 6, 1, 1, 3)
+        
+        self.live_filter_check = QCheckBox("Live Preview")
+        self.live_filter_check.setChecked(True)
+        filter_layout.addWidget(self.live_filter_check, 7, 0, 1, 2)
+        self.filter_matches_label = QLabel("Matches: N/A")
+        filter_layout.addWidget(self.filter_matches_label, 8, 0, 1, 4)
         
         self.apply_filter_btn = QPushButton("Apply Filter")
-        filter_layout.addWidget(self.apply_filter_btn, 4, 0, 1, 3)
+        self.select_matches_btn = QPushButton("Select Matches")
+        filter_layout.addWidget(self.apply_filter_btn, 9, 0, 1, 2)
+        filter_layout.addWidget(self.select_matches_btn, 9, 2, 1, 2)
+        self.export_matches_btn = QPushButton("Export Matches...")
+        filter_layout.addWidget(self.export_matches_btn, 10, 0, 1, 4)
+        
+        # Whole-image evaluation is debounced while the controls are moving
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(120)
+        self.filter_timer.timeout.connect(self.update_live_filter)
+        self.mask_filter = None
+        # Channel type the filter controls are currently set up for
+        self.filter_dtype = np.dtype(np.uint8)
+        # The expression's whole-image mask is cached until the expression or
+        # the image changes; filter_mask combines it with the channel filters
+        self.filter_expression = None
+        self.expression_mask = None
+        self.filter_mask = None
+        
+        # Comparison against a second image of the same size
+        self.compare_group = QGroupBox("Comparison")
+        compare_layout = QGridLayout(self.compare_group)
+        
+        compare_layout.addWidget(QLabel("Difference:"), 0, 0)
+        self.difference_mode = QComboBox()
+        self.difference_mode.addItems(["Off", "Max Channel", "Red", "Green", "Blue", "Alpha", "Thresholded"])
+        compare_layout.addWidget(self.difference_mode, 0, 1)
+        
+        compare_layout.addWidget(QLabel("Threshold:"), 1, 0)
+        self.difference_threshold = QSpinBox()
+        self.difference_threshold.setRange(0, 254)
+        compare_layout.addWidget(self.difference_threshold, 1, 1)
+        
+        compare_font = QFont("Monospace")
+        compare_font.setStyleHint(QFont.TypeWriter)
+        self.compare_hover_label = QLabel("A: N/A\nB: N/A")
+        self.compare_hover_label.setFont(compare_font)
+        compare_layout.addWidget(self.compare_hover_label, 2, 0, 1, 2)
+        self.compare_metrics_label = QLabel("")
+        self.compare_metrics_label.setFont(compare_font)
+        compare_layout.addWidget(self.compare_metrics_label, 3, 0, 1, 2)
+        
+        self.select_changed_btn = QPushButton("Select Changed")
+        compare_layout.addWidget(self.select_changed_btn, 4, 0)
+        self.close_compare_btn = QPushButton("Close Comparison")
+        compare_layout.addWidget(self.close_compare_btn, 4, 1)
+        self.compare_group.hide()
         
         # Selected pixels table
-        self.pixels_table = QTableWidget()
-        self.pixels_table.setColumnCount(6)
-        self.pixels_table.setHorizontalHeaderLabels(["X", "Y", "R", "G", "B", "A"])
+        self.pixels_table = QTableView()
         self.pixels_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Fixed row heights keep scrolling O(visible rows) on huge selections
+        self.pixels_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.pixels_table.verticalHeader().setDefaultSectionSize(22)
         
         # Add groups to right panel
         right_panel.addWidget(info_group)
+        right_panel.addWidget(histogram_group)
         right_panel.addWidget(manual_group)
+        right_panel.addWidget(region_group)
         right_panel.addWidget(filter_group)
+        right_panel.addWidget(self.compare_group)
         right_panel.addWidget(QLabel("Selected Pixels:"))
         right_panel.addWidget(self.pixels_table, 1)
         
@@ -427,16 +2081,46 @@ class RGBAnalyzer(QMainWindow):
         # Connect signals
         self.image_viewer.pixelSelected.connect(self.handle_pixel_selected)
         self.image_viewer.pixelHovered.connect(self.handle_pixel_hover)
+        self.image_viewer.rectangleChanged.connect(self.handle_rectangle_changed)
+        self.image_viewer.polygonSelected.connect(self.handle_polygon_selected)
+        self.selection_tool.currentIndexChanged.connect(self.update_selection_tool)
+        self.histogram_source.currentIndexChanged.connect(self.update_histogram)
+        self.image_viewer.viewChanged.connect(self.schedule_visible_histogram)
+        self.image_viewer.viewChanged.connect(lambda: self.sync_views(self.image_viewer, self.compare_viewer))
+        self.compare_viewer.viewChanged.connect(lambda: self.sync_views(self.compare_viewer, self.image_viewer))
+        self.compare_viewer.pixelHovered.connect(self.handle_compare_hover)
+        self.difference_mode.currentIndexChanged.connect(self.update_difference)
+        self.difference_threshold.valueChanged.connect(self.update_difference)
+        self.select_changed_btn.clicked.connect(self.select_changed_pixels)
+        self.close_compare_btn.clicked.connect(self.close_comparison)
         self.zoom_in_btn.clicked.connect(self.image_viewer.zoom_in)
         self.zoom_out_btn.clicked.connect(self.image_viewer.zoom_out)
         self.zoom_reset_btn.clicked.connect(self.image_viewer.reset_zoom)
+        self.prev_frame_btn.clicked.connect(lambda: self.show_frame(self.frame_index - 1))
+        self.next_frame_btn.clicked.connect(lambda: self.show_frame(self.frame_index + 1))
+        self.frame_slider.valueChanged.connect(self.show_frame)
+        self.trace_btn.clicked.connect(self.trace_pixels)
+        self.window_low.valueChanged.connect(self.apply_display_window)
+        self.window_high.valueChanged.connect(self.apply_display_window)
+        self.window_auto_btn.clicked.connect(self.auto_display_window)
+        self.window_full_btn.clicked.connect(self.full_range_display_window)
         self.clear_btn.clicked.connect(self.clear_all)
-        self.export_btn.clicked.connect(self.export_to_csv)
+        self.dedupe_btn.clicked.connect(self.remove_duplicates)
+        self.export_btn.clicked.connect(self.export_selection)
+        self.export_matches_btn.clicked.connect(self.export_matches)
         self.select_btn.clicked.connect(self.select_manual_pixel)
+        self.import_coords_btn.clicked.connect(self.import_coordinates)
+        self.find_color_btn.clicked.connect(self.find_selected_color)
         self.apply_filter_btn.clicked.connect(self.apply_filters)
-        
-        # Create menu bar
-        self.create_menu()
+        self.select_matches_btn.clicked.connect(self.select_filter_matches)
+        self.filter_mode.currentIndexChanged.connect(self.update_filter_mode)
+        self.filter_expression_input.editingFinished.connect(self.compile_filter_expression)
+        for control in (self.r_filter, self.g_filter, self.b_filter, self.a_filter,
+                        self.r_tolerance, self.g_tolerance, self.b_tolerance, self.a_tolerance):
+            control.valueChanged.connect(self.schedule_live_filter)
+        for check in (self.r_check, self.g_check, self.b_check, self.a_check,
+                      self.live_filter_check):
+            check.toggled.connect(self.schedule_live_filter)
         
     def create_menu(self):
         menu_bar = self.menuBar()
@@ -448,6 +2132,24 @@ class RGBAnalyzer(QMainWindow):
         open_action.setShortcut("Ctrl+O")
         open_action.triggered.connect(self.open_image)
         
+        sequence_action = file_menu.addAction("Open Image Sequence...")
+        sequence_action.triggered.connect(self.open_image_sequence)
+        
+        compare_action = file_menu.addAction("Compare With Image...")
+        compare_action.triggered.connect(self.open_comparison_image)
+        
+        self.recent_menu = file_menu.addMenu("Recent")
+        self.recent_menu.aboutToShow.connect(self.update_recent_menu)
+        
+        cache_budget_action = file_menu.addAction("Image Cache Budget...")
+        cache_budget_action.triggered.connect(self.set_image_cache_budget)
+        
+        disk_budget_action = file_menu.addAction("Disk Cache Budget...")
+        disk_budget_action.triggered.connect(self.set_disk_cache_budget)
+        
+        clear_disk_action = file_menu.addAction("Clear Disk Cache")
+        clear_disk_action.triggered.connect(self.clear_disk_cache)
+        
         exit_action = file_menu.addAction("Exit")
         exit_action.setShortcut("Ctrl+Q")
         exit_action.triggered.connect(self.close)
@@ -460,43 +2162,618 @@ class RGBAnalyzer(QMainWindow):
         hover_action.setChecked(True)
         hover_action.toggled.connect(self.image_viewer.set_hover_enabled)
         
+        tiles_action = view_menu.addAction("Always Use Tiled Rendering")
+        tiles_action.setCheckable(True)
+        tiles_action.setChecked(False)
+        tiles_action.toggled.connect(self.image_viewer.set_force_tiles)
+        
+        grid_action = view_menu.addAction("Pixel Grid and Values at High Zoom")
+        grid_action.setCheckable(True)
+        grid_action.setChecked(True)
+        grid_action.toggled.connect(self.image_viewer.set_pixel_grid_enabled)
+        grid_action.toggled.connect(self.compare_viewer.set_pixel_grid_enabled)
+        
+        view_menu.addSeparator()
+        hover_stats_action = view_menu.addAction("Hover Statistics...")
+        hover_stats_action.triggered.connect(self.show_hover_stats)
+        
+        # Hot-path timings; off unless started here or with PIXEL_PERF=1
+        perf_menu = view_menu.addMenu("Performance")
+        self.perf_record_action = perf_menu.addAction("Record Timings")
+        self.perf_record_action.setCheckable(True)
+        self.perf_record_action.setChecked(PERF.enabled)
+        self.perf_record_action.toggled.connect(self.set_perf_recording)
+        self.perf_trace_action = perf_menu.addAction("Record Trace Events")
+        self.perf_trace_action.setCheckable(True)
+        self.perf_trace_action.setChecked(PERF.tracing)
+        self.perf_trace_action.toggled.connect(self.set_perf_recording)
+        self.perf_overlay_action = perf_menu.addAction("Show Performance Overlay")
+        self.perf_overlay_action.setCheckable(True)
+        self.perf_overlay_action.toggled.connect(self.set_perf_overlay_visible)
+        perf_menu.addSeparator()
+        save_timings_action = perf_menu.addAction("Save Timings as JSON...")
+        save_timings_action.triggered.connect(self.save_perf_timings)
+        save_trace_action = perf_menu.addAction("Save Chrome Trace...")
+        save_trace_action.triggered.connect(self.save_perf_trace)
+        reset_timings_action = perf_menu.addAction("Reset Timings")
+        reset_timings_action.triggered.connect(PERF.reset)
+        
+        # Frames menu
+        frames_menu = menu_bar.addMenu("Frames")
+        
+        prev_frame_action = frames_menu.addAction("Previous Frame")
+        prev_frame_action.setShortcut("PgUp")
+        prev_frame_action.triggered.connect(lambda: self.show_frame(self.frame_index - 1))
+        next_frame_action = frames_menu.addAction("Next Frame")
+        next_frame_action.setShortcut("PgDown")
+        next_frame_action.triggered.connect(lambda: self.show_frame(self.frame_index + 1))
+        frames_menu.addSeparator()
+        trace_action = frames_menu.addAction("Pixel Through Time...")
+        trace_action.triggered.connect(self.trace_pixels)
+        
+        # Analysis menu
+        analysis_menu = menu_bar.addMenu("Analysis")
+        
+        palette_action = analysis_menu.addAction("Colour Palette...")
+        palette_action.triggered.connect(self.show_palette)
+        
     def open_image(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self,
             "Open Image",
             "",
-            "Images (*.png *.jpg *.jpeg *.bmp *.tiff)"
+            IMAGE_FILE_FILTER
         )
         
         if file_path:
-            if self.image_viewer.load_image(file_path):
-                self.image_path = file_path
-                self.setWindowTitle(f"🖤 RGBA Pixel Analyzer - {file_path}")
-                self.clear_all()
-            else:
-                QMessageBox.critical(self, "Error", "Failed to load image")
-                
+            self.start_loading(file_path)
+            
+    def open_image_sequence(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "Open Image Sequence",
+            "",
+            IMAGE_FILE_FILTER
+        )
+        if file_paths:
+            frames = list_frames(sorted(file_paths, key=natural_sort_key))
+            self.start_loading(frames[0][0], frames)
+            
+    def update_recent_menu(self):
+        self.recent_menu.clear()
+        for entry in self.image_cache.recent():
+            path = entry["path"]
+            action = self.recent_menu.addAction(
+                f"{os.path.basename(path)}  ({entry['nbytes'] / 1048576:.0f} MB)"
+            )
+            action.setToolTip(path)
+            action.setCheckable(True)
+            action.setChecked(entry is self.image_entry)
+            action.triggered.connect(lambda checked=False, path=path: self.start_loading(path))
+        if self.recent_menu.isEmpty():
+            self.recent_menu.addAction("No cached images").setEnabled(False)
+            return
+        self.recent_menu.addSeparator()
+        clear_action = self.recent_menu.addAction(
+            f"Clear Image Cache ({self.image_cache.nbytes / 1048576:.0f} MB)"
+        )
+        clear_action.triggered.connect(self.image_cache.clear)
+        
+    def set_image_cache_budget(self):
+        budget, ok = QInputDialog.getInt(
+            self, "Image Cache Budget", "Memory for recent images (MB):",
+            self.image_cache.budget_bytes // 1048576, 0, 1 << 20
+        )
+        if ok:
+            self.image_cache.set_budget(budget * 1048576)
+            
+    def set_disk_cache_budget(self):
+        budget, ok = QInputDialog.getInt(
+            self, "Disk Cache Budget",
+            f"Disk space for opened images and their analysis data (MB, 0 turns it off):\n{self.disk_cache.root}",
+            self.disk_cache.budget_bytes // 1048576, 0, 1 << 24
+        )
+        if ok:
+            self.disk_cache.set_budget(budget * 1048576)
+            
+    def clear_disk_cache(self):
+        nbytes = self.disk_cache.nbytes
+        self.disk_cache.clear()
+        self.statusBar().showMessage(f"Cleared the disk cache ({nbytes / 1048576:.0f} MB)", 3000)
+        
+    @PERF.timed("load.disk_cache")
+    def open_from_disk_cache(self, file_path):
+        # Maps the stored pixels and derived data of a file opened before
+        # instead of decoding it; None when the disk cache has no valid entry
+        try:
+            source = DiskCache.file_stamp(file_path)
+        except OSError:
+            return None
+        artifacts = self.disk_cache.get(file_path, source=source)
+        if artifacts is None or "pixels" not in artifacts:
+            return None
+        pixels = artifacts.pop("pixels")["pixels"]
+        image = array_to_qimage(pixels)
+        entry = self.image_cache.put(file_path, image, image.sizeInBytes())
+        if entry is None:
+            return None
+        entry["source"] = source
+        for name, arrays in artifacts.items():
+            build = DISK_CACHE_DERIVED.get(name)
+            try:
+                value = build.from_arrays(pixels, arrays) if build is not None else None
+            except (KeyError, IndexError, ValueError):
+                value = None
+            if value is not None:
+                self.image_cache.attach(entry, name, value, value.nbytes)
+        return entry
+        
+    def store_on_disk(self, entry, name, arrays):
+        # Only images opened as files persist; frames read ahead do not. The
+        # entry's source stamp was taken before its pixels were read.
+        if entry is None or entry.get("source") is None or not self.disk_cache.budget_bytes:
+            return
+        task = DiskCacheTask(self.disk_cache, entry["path"], name, arrays, entry["page"], entry["source"])
+        self.running_disk_tasks = [t for t in self.running_disk_tasks if not t.done]
+        self.running_disk_tasks.append(task)
+        # Behind analysis and frame reads
+        self.thread_pool.start(task, -1)
+        
+    def start_loading(self, file_path, frames=None):
+        # A new load supersedes any load still in flight. frames lists the
+        # sequence the file starts; by default it is the file's own pages.
+        self.cancel_loading()
+        self.cancel_frame_reads()
+        self.pending_frames = frames if frames is not None else list_frames([file_path])
+        entry, source = self.image_cache.get(file_path), "image cache"
+        if entry is None:
+            entry, source = self.open_from_disk_cache(file_path), "disk cache"
+        if entry is not None:
+            self.show_image(file_path, entry["image"], entry)
+            self.statusBar().showMessage(f"Opened {file_path} from the {source}", 3000)
+            return
+            
+        self.load_generation += 1
+        self.previous_image = self.image_viewer.image
+        self.previous_entry = self.image_entry
+        self.preview_shown = False
+        
+        task = ImageLoadTask(self.load_generation, file_path)
+        task.signals.preview.connect(self.handle_load_preview)
+        task.signals.progress.connect(self.handle_load_progress)
+        task.signals.finished.connect(self.handle_load_finished)
+        task.signals.failed.connect(self.handle_load_failed)
+        self.load_task = task
+        self.running_load_tasks = [t for t in self.running_load_tasks if not t.done]
+        self.running_load_tasks.append(task)
+        
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.load_cancel_btn.show()
+        self.statusBar().showMessage(f"Loading {file_path}...")
+        self.thread_pool.start(task)
+        
+    def cancel_loading(self):
+        if self.load_task is None:
+            return
+        self.load_task.cancel()
+        self.thread_pool.tryTake(self.load_task)
+        self.finish_loading()
+        self.restore_previous_image()
+        self.statusBar().showMessage("Loading cancelled", 3000)
+        
+    def finish_loading(self):
+        self.load_generation += 1
+        self.load_task = None
+        self.load_progress.hide()
+        self.load_cancel_btn.hide()
+        self.statusBar().clearMessage()
+        
+    def restore_previous_image(self):
+        # Put the previous image back if a preview had replaced it
+        if self.preview_shown and self.previous_image is not None:
+            self.image_viewer.set_image(self.previous_image)
+            self.image_entry = self.previous_entry
+            self.mask_filter = ChannelMaskFilter(self.image_viewer.pixels)
+            self.update_depth_controls()
+            self.schedule_live_filter()
+            self.reset_image_analysis()
+        self.previous_image = None
+        self.previous_entry = None
+        self.preview_shown = False
+        
+    def handle_load_preview(self, generation, preview, full_size):
+        if generation != self.load_generation:
+            return
+        self.filter_timer.stop()
+        self.mask_filter = None
+        self.preview_shown = True
+        self.image_entry = None
+        self.image_viewer.show_preview(preview, full_size)
+        self.reset_image_analysis()
+        
+    def handle_load_progress(self, generation, value):
+        if generation == self.load_generation:
+            self.load_progress.setValue(value)
+            
+    def handle_load_finished(self, generation, image):
+        if generation != self.load_generation:
+            return
+        file_path, source = self.load_task.image_path, self.load_task.source
+        self.finish_loading()
+        entry = self.image_cache.put(file_path, image, image.sizeInBytes())
+        if entry is not None:
+            entry["source"] = source
+            self.store_on_disk(entry, "pixels", {"pixels": qimage_to_array(image)})
+        
+        # Keep the zoom/pan the user chose on the preview
+        self.show_image(file_path, image, entry, reset_view=not self.preview_shown)
+        
+    def show_image(self, file_path, image, entry, reset_view=True, frame=False):
+        # A frame of the same size as the one shown keeps the view and the
+        # selected coordinates, whose values are read again from the new frame
+        current = self.image_viewer.image
+        keep = frame and current is not None and image.size() == current.size()
+        self.image_viewer.set_image(image, reset_view=reset_view and not keep)
+        self.image_entry = entry
+        self.previous_image = None
+        self.previous_entry = None
+        self.preview_shown = False
+        self.image_path = file_path
+        if not frame:
+            self.set_frames(self.pending_frames or [(file_path, 0)])
+        title = f"🖤 RGBA Pixel Analyzer - {file_path}"
+        if len(self.frames) > 1:
+            title += f" [frame {self.frame_index + 1} / {len(self.frames)}]"
+        self.setWindowTitle(title)
+        self.mask_filter = ChannelMaskFilter(self.image_viewer.pixels)
+        if keep:
+            self.resample_selection()
+        else:
+            self.clear_all()
+        self.update_depth_controls()
+        self.schedule_live_filter()
+        self.reset_image_analysis()
+        
+    def handle_load_failed(self, generation, message):
+        if generation != self.load_generation:
+            return
+        self.finish_loading()
+        self.restore_previous_image()
+        QMessageBox.critical(self, "Error", f"Failed to load image: {message}")
+        
+    def set_frames(self, frames):
+        self.cancel_frame_reads()
+        self.frame_cache.clear()
+        self.frames = frames
+        self.pending_frames = None
+        self.frame_index = 0
+        self.frame_direction = 1
+        self.update_frame_controls()
+        self.prefetch_frames()
+        
+    def update_frame_controls(self):
+        count = len(self.frames)
+        self.frame_bar.setVisible(count > 1)
+        if count < 2:
+            return
+        self.frame_slider.blockSignals(True)
+        self.frame_slider.setRange(0, count - 1)
+        self.frame_slider.setValue(self.frame_index)
+        self.frame_slider.blockSignals(False)
+        path, page = self.frames[self.frame_index]
+        self.frame_label.setText(f"Frame {self.frame_index + 1} / {count}")
+        self.frame_label.setToolTip(f"{path}, page {page + 1}")
+        self.prev_frame_btn.setEnabled(self.frame_index > 0)
+        self.next_frame_btn.setEnabled(self.frame_index < count - 1)
+        if self.trace_dialog is not None:
+            self.trace_dialog.set_frame(self.frame_index)
+            
+    def cached_frame(self, index):
+        # The opened file itself lives in the image cache, the other frames
+        # in the frame cache
+        path, page = self.frames[index]
+        if index == 0:
+            entry = self.image_cache.get(path, page)
+            if entry is not None:
+                return entry
+        return self.frame_cache.get(path, page)
+        
+    @PERF.timed("frames.step")
+    def show_frame(self, index):
+        if len(self.frames) < 2 or self.image_viewer.image is None:
+            return
+        index = min(max(index, 0), len(self.frames) - 1)
+        if index == self.frame_index:
+            return
+        self.frame_direction = 1 if index > self.frame_index else -1
+        self.frame_index = index
+        self.update_frame_controls()
+        entry = self.cached_frame(index)
+        if entry is not None:
+            self.waiting_frame = None
+            self.show_frame_image(index, entry)
+        else:
+            # Shown by handle_frame_loaded once its read completes
+            self.waiting_frame = index
+            self.statusBar().showMessage(f"Loading frame {index + 1}...")
+        self.prefetch_frames()
+        
+    def show_frame_image(self, index, entry):
+        path, page = self.frames[index]
+        self.show_image(path, entry["image"], entry, frame=True)
+        
+    def prefetch_frames(self):
+        # Read ahead in the stepping direction, and a frame behind, as far as
+        # the frame cache can hold. The frame waited for is read first.
+        if len(self.frames) < 2:
+            return
+        index, step = self.frame_index, self.frame_direction
+        order = [index + step * k for k in range(1, FRAME_PREFETCH_AHEAD + 1)]
+        order += [index - step * k for k in range(1, FRAME_PREFETCH_BEHIND + 1)]
+        wanted = [i for i in order if 0 <= i < len(self.frames)]
+        image = self.image_viewer.image
+        if image is not None:
+            wanted = wanted[:max(1, self.frame_cache.budget_bytes // max(image.sizeInBytes(), 1) - 1)]
+        if self.waiting_frame is not None:
+            wanted.insert(0, self.waiting_frame)
+            
+        # Reads not started yet that are no longer wanted are dropped
+        for serial, (frame, task) in list(self.prefetch_tasks.items()):
+            if frame not in wanted and self.thread_pool.tryTake(task):
+                del self.prefetch_tasks[serial]
+        reading = {frame for frame, _ in self.prefetch_tasks.values()}
+        for frame in wanted:
+            if frame in reading or self.cached_frame(frame) is not None:
+                continue
+            self.prefetch_serial += 1
+            path, page = self.frames[frame]
+            task = ImageLoadTask(self.prefetch_serial, path, page, preview=False)
+            task.signals.finished.connect(self.handle_frame_loaded)
+            task.signals.failed.connect(self.handle_frame_failed)
+            self.prefetch_tasks[self.prefetch_serial] = (frame, task)
+            self.running_load_tasks = [t for t in self.running_load_tasks if not t.done]
+            self.running_load_tasks.append(task)
+            # Ahead of background analysis, the waited-for frame first
+            self.thread_pool.start(task, 2 if frame == self.waiting_frame else 1)
+            
+    def cancel_frame_reads(self):
+        for _, task in self.prefetch_tasks.values():
+            task.cancel()
+            self.thread_pool.tryTake(task)
+        self.prefetch_tasks.clear()
+        self.waiting_frame = None
+        
+    def handle_frame_loaded(self, serial, image):
+        read = self.prefetch_tasks.pop(serial, None)
+        if read is None:
+            return
+        index = read[0]
+        path, page = self.frames[index]
+        entry = self.frame_cache.put(path, image, image.sizeInBytes(), page)
+        if index == self.waiting_frame:
+            self.waiting_frame = None
+            self.statusBar().clearMessage()
+            self.show_frame_image(index, entry or {"image": image, "derived": {}})
+            
+    def handle_frame_failed(self, serial, message):
+        read = self.prefetch_tasks.pop(serial, None)
+        if read is not None and read[0] == self.waiting_frame:
+            self.waiting_frame = None
+            self.statusBar().showMessage(f"Failed to load frame {read[0] + 1}: {message}", 5000)
+            
+    def resample_selection(self):
+        # Same coordinates, values of the frame now shown
+        self.selected_pixels.resample(self.image_viewer.pixels)
+        self.image_viewer.refresh_selection_markers()
+        self.image_viewer.draw_pixel_markers()
+        self.update_pixels_table()
+        if self.image_viewer.hover_pixel is not None:
+            x, y = self.image_viewer.hover_pixel
+            self.handle_pixel_hover(x, y, self.image_viewer.pixel_color(x, y))
+            
+    def trace_coordinates(self):
+        # Distinct selected coordinates in selection order, else the selected pixel
+        store = self.selected_pixels
+        if len(store):
+            keys = (store.ys.astype(np.int64) << 32) | store.xs.astype(np.int64)
+            _, first = np.unique(keys, return_index=True)
+            first.sort()
+            return store.xs[first], store.ys[first]
+        if self.image_viewer.selected_pixel is not None:
+            x, y = self.image_viewer.selected_pixel
+            return np.array([x]), np.array([y])
+        return None
+        
+    def trace_pixels(self):
+        if len(self.frames) < 2:
+            QMessageBox.information(self, "Pixel Through Time", "Open a multi-page TIFF or an image sequence first")
+            return
+        coordinates = self.trace_coordinates()
+        if coordinates is None:
+            QMessageBox.warning(self, "No Pixels", "Select the pixels to trace through the frames")
+            return
+        xs, ys = coordinates
+        nbytes = PixelTrace.nbytes_for(len(self.frames), len(xs), self.image_viewer.pixels.dtype)
+        if nbytes > TRACE_MAX_BYTES:
+            QMessageBox.warning(
+                self, "Trace Too Large",
+                f"Tracing {len(xs):,} pixels through {len(self.frames)} frames needs "
+                f"{nbytes / 1048576:.0f} MB; select fewer pixels"
+            )
+            return
+        if self.trace_task is not None:
+            self.trace_task.cancel()
+        self.trace_generation += 1
+        task = TraceTask(self.trace_generation, list(self.frames), xs, ys)
+        task.signals.progress.connect(self.handle_trace_progress)
+        task.signals.finished.connect(self.handle_trace_finished)
+        task.signals.failed.connect(self.handle_trace_failed)
+        self.trace_task = task
+        self.running_analysis_tasks = [t for t in self.running_analysis_tasks if not t.done]
+        self.running_analysis_tasks.append(task)
+        self.statusBar().showMessage(f"Tracing {len(xs):,} pixels through {len(self.frames)} frames...")
+        self.thread_pool.start(task)
+        
+    def handle_trace_progress(self, generation, percent):
+        if generation == self.trace_generation:
+            self.statusBar().showMessage(f"Tracing pixels through the frames: {percent}%")
+            
+    def handle_trace_finished(self, generation, trace):
+        if generation != self.trace_generation:
+            return
+        self.trace_task = None
+        self.statusBar().clearMessage()
+        if self.trace_dialog is None:
+            self.trace_dialog = TraceDialog(self)
+            self.trace_dialog.frameActivated.connect(self.show_frame)
+        self.trace_dialog.set_trace(trace, self.frame_index)
+        self.trace_dialog.show()
+        self.trace_dialog.raise_()
+        
+    def handle_trace_failed(self, generation, message):
+        if generation != self.trace_generation:
+            return
+        self.trace_task = None
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Error", f"Failed to trace pixels: {message}")
+        
+    def update_depth_controls(self):
+        # Filter and tolerance ranges follow the channel type of the image;
+        # when it changes, the filters restart from their defaults
+        pixels = self.image_viewer.pixels
+        dtype = np.dtype(np.uint8) if pixels is None else pixels.dtype
+        if dtype != self.filter_dtype:
+            self.filter_dtype = dtype
+            low, high = nominal_range(dtype)
+            floating = dtype.kind == "f"
+            # Float data is not confined to 0-1, so its bounds are open-ended
+            limit = 1e9 if floating else high
+            for spin in (self.r_filter, self.g_filter, self.b_filter, self.a_filter,
+                         self.r_tolerance, self.g_tolerance, self.b_tolerance, self.a_tolerance,
+                         self.find_tolerance):
+                spin.blockSignals(True)
+                spin.setDecimals(4 if floating else 0)
+                spin.setSingleStep(0.01 if floating else 1)
+                spin.setRange(-limit if floating and spin is not self.find_tolerance else 0, limit)
+                spin.blockSignals(False)
+            range_mode = self.filter_mode.currentIndex() == 1
+            for spin, second in ((self.r_filter, self.r_tolerance), (self.g_filter, self.g_tolerance),
+                                 (self.b_filter, self.b_tolerance), (self.a_filter, self.a_tolerance)):
+                spin.setValue(low if range_mode else high)
+                second.setValue(high if range_mode else 0)
+            self.find_tolerance.setValue(0)
+            
+        self.display_group.setVisible(self.image_viewer.high_depth())
+        if self.image_viewer.high_depth():
+            self.show_display_window(*self.image_viewer.display_window)
+        self.pixels_model.set_display_window(self.image_viewer.display_window)
+        
+    def show_display_window(self, low, high):
+        for spin, value in ((self.window_low, low), (self.window_high, high)):
+            spin.blockSignals(True)
+            spin.setValue(value)
+            spin.blockSignals(False)
+            
+    def apply_display_window(self):
+        low, high = self.window_low.value(), self.window_high.value()
+        if not self.image_viewer.high_depth() or high <= low:
+            return
+        self.image_viewer.set_display_window(low, high)
+        self.pixels_model.set_display_window((low, high))
+        if self.image_viewer.hover_pixel is not None:
+            x, y = self.image_viewer.hover_pixel
+            self.handle_pixel_hover(x, y, self.image_viewer.pixel_color(x, y))
+            
+    def auto_display_window(self):
+        if self.image_viewer.high_depth():
+            self.show_display_window(*auto_window(self.image_viewer.pixels))
+            self.apply_display_window()
+            
+    def full_range_display_window(self):
+        if self.image_viewer.high_depth():
+            self.show_display_window(*nominal_range(self.image_viewer.pixels.dtype))
+            self.apply_display_window()
+            
+    @PERF.timed("hover.handler")
     def handle_pixel_hover(self, x, y, color):
+        # Values are read at native depth; color is only what is displayed
+        rgba = self.image_viewer.pixel_rgba(x, y)
+        dtype = self.image_viewer.pixels.dtype
         self.pos_label.setText(f"Position: ({x}, {y})")
-        self.rgba_label.setText(f"RGBA: ({color.red()}, {color.green()}, {color.blue()}, {color.alpha()})")
-        self.hex_label.setText(f"Hex: {color.name()}")
+        self.rgba_label.setText(f"RGBA: ({', '.join(map(format_channel, rgba))})")
+        if dtype == np.uint16:
+            self.hex_label.setText("Hex: #" + "".join(f"{value:04x}" for value in rgba[:3]))
+        elif dtype.kind == "f":
+            self.hex_label.setText(f"Hex: {color.name()} (displayed)")
+        else:
+            self.hex_label.setText(f"Hex: {color.name()}")
         
         # Update color preview
-        self.color_preview.setStyleSheet(
-            f"background-color: {color.name()}; border: 1px solid #555;"
+        self.color_preview.set_color(color)
+        if self.compare_viewer.pixels is not None:
+            self.show_compare_hover(x, y)
+            
+    def handle_compare_hover(self, x, y, color):
+        if self.image_viewer.pixels is not None:
+            self.handle_pixel_hover(x, y, self.image_viewer.pixel_color(x, y))
+            
+    def show_compare_hover(self, x, y):
+        self.image_viewer.mirror_hover(x, y)
+        self.compare_viewer.mirror_hover(x, y)
+        a = self.image_viewer.pixel_rgba(x, y)
+        b = self.compare_viewer.pixel_rgba(x, y)
+        delta = tuple(abs(p - q) for p, q in zip(a, b))
+        self.compare_hover_label.setText(
+            f"A: {a}\nB: {b}\nDiff: {delta}  max {max(delta)}"
+        )
+        
+    def set_perf_recording(self, checked=False):
+        # Tracing implies recording; turning recording off stops both
+        if self.sender() is self.perf_trace_action and checked:
+            self.perf_record_action.setChecked(True)
+        elif self.sender() is self.perf_record_action and not checked:
+            self.perf_trace_action.setChecked(False)
+        PERF.enable(self.perf_record_action.isChecked(), tracing=self.perf_trace_action.isChecked())
+        
+    def set_perf_overlay_visible(self, visible):
+        if visible and self.perf_overlay is None:
+            self.perf_overlay = PerfOverlay(self.image_viewer)
+        if visible:
+            self.perf_record_action.setChecked(True)
+        if self.perf_overlay is not None:
+            self.perf_overlay.setVisible(visible)
+            
+    def save_perf_timings(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Timings", "timings.json", "JSON (*.json)")
+        if file_path:
+            PERF.dump_json(file_path)
+            
+    def save_perf_trace(self):
+        if not PERF.trace:
+            QMessageBox.information(
+                self, "No Trace Events",
+                "Turn on View > Performance > Record Trace Events and use the viewer first"
+            )
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Chrome Trace", "trace.json", "JSON (*.json)")
+        if file_path:
+            PERF.dump_chrome_trace(file_path)
+            
+    def show_hover_stats(self):
+        stats = self.image_viewer.hover_stats()
+        QMessageBox.information(
+            self,
+            "Hover Statistics",
+            f"Mouse move events: {stats['events']}\n"
+            f"Processed updates: {stats['processed']}\n"
+            f"Dropped (coalesced or unchanged): {stats['dropped']}"
         )
         
     def handle_pixel_selected(self, x, y, color):
-        # Add to selected pixels
-        self.selected_pixels.append({
-            "x": x,
-            "y": y,
-            "r": color.red(),
-            "g": color.green(),
-            "b": color.blue(),
-            "a": color.alpha(),
-            "color": color
-        })
+        # Add to selected pixels, reading the value from the image buffer
+        self.selected_pixels.append(x, y, self.image_viewer.pixels[y, x])
+        self.image_viewer.add_selection_markers([x], [y])
         
         # Update table
         self.update_pixels_table()
@@ -514,93 +2791,641 @@ class RGBAnalyzer(QMainWindow):
             return
             
         # Simulate selection
-        color = self.image_viewer.image.pixelColor(x, y)
+        color = self.image_viewer.pixel_color(x, y)
         self.handle_pixel_selected(x, y, color)
         
         # Set as selected in viewer
         self.image_viewer.selected_pixel = (x, y)
         self.image_viewer.draw_pixel_markers()
         
-    def update_pixels_table(self):
-        self.pixels_table.setRowCount(len(self.selected_pixels))
-        
-        for row, pixel in enumerate(self.selected_pixels):
-            self.pixels_table.setItem(row, 0, QTableWidgetItem(str(pixel['x'])))
-            self.pixels_table.setItem(row, 1, QTableWidgetItem(str(pixel['y'])))
-            self.pixels_table.setItem(row, 2, QTableWidgetItem(str(pixel['r'])))
-            self.pixels_table.setItem(row, 3, QTableWidgetItem(str(pixel['g'])))
-            self.pixels_table.setItem(row, 4, QTableWidgetItem(str(pixel['b'])))
-            self.pixels_table.setItem(row, 5, QTableWidgetItem(str(pixel['a'])))
-            
-            # Set background color
-            for col in range(6):
-                item = self.pixels_table.item(row, col)
-                item.setBackground(pixel['color'])
-                
-    def apply_filters(self):
-        if not self.selected_pixels:
+    def import_coordinates(self):
+        if self.image_viewer.pixels is None:
+            QMessageBox.warning(self, "No Image", "Open an image before importing coordinates")
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Import Coordinates",
+            "",
+            "Coordinate Lists (*.csv *.txt *.npy *.npz)"
+        )
+        if not file_path:
             return
             
-        # Get filter values
-        r_val = self.r_filter.value() if self.r_check.isChecked() else None
-        g_val = self.g_filter.value() if self.g_check.isChecked() else None
-        b_val = self.b_filter.value() if self.b_check.isChecked() else None
-        a_val = self.a_filter.value() if self.a_check.isChecked() else None
+        try:
+            xs, ys = load_coordinates(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to import coordinates: {str(e)}")
+            return
+            
+        # One bounds check and one gather for the whole list, then a single
+        # batch append and table refresh
+        values, inside = sample_pixels(self.image_viewer.pixels, xs, ys)
+        xs, ys = xs[inside], ys[inside]
+        self.selected_pixels.extend(xs, ys, values)
+        self.image_viewer.add_selection_markers(xs, ys)
+        self.update_pixels_table()
         
-        # Filter selected pixels
-        filtered_pixels = []
-        for pixel in self.selected_pixels:
-            if r_val is not None and pixel['r'] != r_val:
-                continue
-            if g_val is not None and pixel['g'] != g_val:
-                continue
-            if b_val is not None and pixel['b'] != b_val:
-                continue
-            if a_val is not None and pixel['a'] != a_val:
+        skipped = len(inside) - len(xs)
+        message = f"Imported {len(xs):,} pixels"
+        if skipped:
+            message += f", skipped {skipped:,} outside the image"
+        self.statusBar().showMessage(message, 5000)
+        
+    @PERF.timed("table.update")
+    def update_pixels_table(self):
+        self.pixels_model.sync()
+        
+    def update_selection_tool(self, index):
+        self.image_viewer.set_selection_mode(("pixel", "rectangle", "lasso")[index])
+        self.pending_region = None
+        if index:
+            self.prepare_region_stats()
+            
+    def cached_derived(self, name):
+        return None if self.image_entry is None else self.image_entry["derived"].get(name)
+        
+    def cache_derived(self, name, value):
+        # Only the cache holding the entry keeps it
+        if self.image_entry is not None:
+            self.image_cache.attach(self.image_entry, name, value, value.nbytes)
+            self.frame_cache.attach(self.image_entry, name, value, value.nbytes)
+            self.store_on_disk(self.image_entry, name, value.to_arrays())
+            
+    def reset_image_analysis(self):
+        # Derived data belongs to one image and is rebuilt for the next one
+        self.expression_mask = None
+        self.filter_mask = None
+        self.reset_region_stats()
+        self.reset_histogram()
+        self.reset_color_index()
+        self.reset_palette()
+        self.reset_comparison()
+        
+    def reset_region_stats(self):
+        # Tables belong to one image; results for a replaced one are dropped
+        self.region_generation += 1
+        self.region_stats = self.cached_derived("region_stats")
+        self.region_task = None
+        self.pending_region = None
+        self.region_label.setText("Drag a rectangle or lasso to measure a region")
+        if self.selection_tool.currentIndex():
+            self.prepare_region_stats()
+            
+    def prepare_region_stats(self):
+        if self.region_stats is not None or self.region_task is not None:
+            return
+        if self.image_viewer.pixels is None or self.image_viewer.high_depth():
+            return
+        self.region_task = self.start_analysis(
+            self.region_generation, self.handle_region_stats_ready,
+            RegionStatistics, self.image_viewer.pixels, current=lambda: self.region_generation
+        )
+        
+    def start_analysis(self, generation, handler, build, *args, current=None):
+        task = AnalysisTask(generation, build, *args, current=current)
+        task.signals.finished.connect(handler)
+        self.running_analysis_tasks = [t for t in self.running_analysis_tasks if not t.done]
+        self.running_analysis_tasks.append(task)
+        self.thread_pool.start(task)
+        return task
+        
+    def handle_region_stats_ready(self, generation, stats):
+        if generation != self.region_generation:
+            return
+        self.region_stats = stats
+        self.region_task = None
+        self.cache_derived("region_stats", stats)
+        self.show_region_stats()
+        
+    def reset_histogram(self):
+        # A cached engine keeps only its tiles while its image is not shown
+        if self.histogram_engine is not None:
+            self.histogram_engine.forget_mask()
+        self.histogram_generation += 1
+        self.histogram_engine = None
+        self.histogram_timer.stop()
+        self.histogram_view.set_histograms(None)
+        if self.image_viewer.pixels is None:
+            self.histogram_label.setText("No image")
+            return
+        if self.image_viewer.high_depth():
+            self.histogram_label.setText("Histograms are available for 8-bit images")
+            return
+        engine = self.cached_derived("histogram")
+        if engine is not None:
+            self.histogram_engine = engine
+            self.update_histogram()
+            return
+        self.histogram_label.setText("Computing histogram...")
+        self.start_analysis(
+            self.histogram_generation, self.handle_histogram_ready,
+            self.build_histogram_engine, self.image_viewer.pixels, current=lambda: self.histogram_generation
+        )
+        
+    @staticmethod
+    def build_histogram_engine(pixels):
+        # Filling every tile up front makes later views pure cache sums
+        engine = HistogramEngine(pixels)
+        engine.histogram()
+        return engine
+        
+    def handle_histogram_ready(self, generation, engine):
+        if generation != self.histogram_generation:
+            return
+        self.histogram_engine = engine
+        self.cache_derived("histogram", engine)
+        self.update_histogram()
+        
+    def schedule_visible_histogram(self):
+        if self.histogram_engine is not None and self.histogram_source.currentIndex() == 1:
+            self.histogram_timer.start()
+            
+    def update_histogram(self):
+        if self.histogram_engine is None:
+            return
+        source = self.histogram_source.currentIndex()
+        if source == 0:
+            histograms = self.histogram_engine.histogram()
+        elif source == 1:
+            histograms = self.histogram_engine.histogram(self.image_viewer.visible_rect())
+        else:
+            histograms = self.histogram_engine.masked_histogram(self.filter_mask)
+        self.histogram_view.set_histograms(histograms)
+        if histograms is None:
+            self.histogram_label.setText("No active filter")
+            return
+            
+        summary = histogram_summary(histograms, percentiles=(5, 50, 95))
+        lines = [f"Pixels: {int(histograms[0].sum()):,}", "     Mean   P5  P50  P95"]
+        for channel, stats in summary.items():
+            if stats is None:
                 continue
-            filtered_pixels.append(pixel)
+            p = stats["percentiles"]
+            lines.append(f"{channel.upper()}  {stats['mean']:7.2f} {p[5]:4d} {p[50]:4d} {p[95]:4d}")
+        self.histogram_label.setText("\n".join(lines))
+        
+    def reset_color_index(self):
+        self.color_index_generation += 1
+        self.color_index = self.cached_derived("color_index")
+        pixels = self.image_viewer.pixels
+        if pixels is None or self.color_index is not None or self.image_viewer.high_depth():
+            return
+        if ColorIndex.max_nbytes(pixels.shape[0] * pixels.shape[1]) <= self.color_index_budget:
+            self.start_analysis(self.color_index_generation, self.handle_color_index_ready, ColorIndex, pixels,
+                                current=lambda: self.color_index_generation)
             
-        # Update selected pixels
-        self.selected_pixels = filtered_pixels
+    def handle_color_index_ready(self, generation, index):
+        if generation != self.color_index_generation:
+            return
+        self.color_index = index
+        self.cache_derived("color_index", index)
+        self.statusBar().showMessage(
+            f"Colour index ready: {index.color_count:,} colours, {index.nbytes / 1048576:.1f} MB", 3000
+        )
+        
+    def find_selected_color(self):
+        pixel = self.image_viewer.selected_pixel
+        if pixel is None or self.image_viewer.pixels is None:
+            QMessageBox.warning(self, "No Pixel", "Select a pixel whose colour should be searched for")
+            return
+        x, y = pixel
+        tolerance = self.find_tolerance.value()
+        if self.image_viewer.pixels.dtype.kind != "f":
+            tolerance = int(tolerance)
+        self.select_color(self.image_viewer.pixels[y, x], tolerance)
+        
+    def select_color(self, rgba, tolerance=0):
+        # Add every pixel within +-tolerance of rgba to the selection
+        if self.image_viewer.pixels is None:
+            return
+        start = time.perf_counter()
+        if self.color_index is not None:
+            xs, ys = self.color_index.coordinates(self.color_index.find_color(rgba, tolerance))
+            method = "index"
+        else:
+            # Index not built (yet) or not available at this depth: scan the image once
+            bounds = [(value - tolerance, value + tolerance) for value in np.asarray(rgba).tolist()]
+            ys, xs = np.nonzero(ChannelMaskFilter(self.image_viewer.pixels).evaluate(bounds))
+            method = "scan"
+        elapsed = (time.perf_counter() - start) * 1000
+        
+        self.selected_pixels.extend(xs, ys, self.image_viewer.pixels[ys, xs])
+        self.image_viewer.add_selection_markers(xs, ys)
         self.update_pixels_table()
+        self.statusBar().showMessage(f"Found {len(xs):,} pixels in {elapsed:.1f} ms ({method})", 5000)
         
+    def show_palette(self):
+        if self.image_viewer.pixels is None:
+            QMessageBox.warning(self, "No Image", "Open an image to extract its palette")
+            return
+        if self.image_viewer.high_depth():
+            QMessageBox.information(self, "Colour Palette", "Palettes are available for 8-bit images")
+            return
+        if self.palette_task is not None:
+            return
+        self.statusBar().showMessage("Extracting colour palette...")
+        self.palette_task = self.start_analysis(
+            self.palette_generation, self.handle_palette_ready, color_palette, self.image_viewer.pixels,
+            current=lambda: self.palette_generation
+        )
+        
+    def reset_palette(self):
+        # A palette still being extracted belongs to the replaced image
+        self.palette_generation += 1
+        if self.palette_task is not None:
+            self.statusBar().clearMessage()
+        self.palette_task = None
+        
+    def handle_palette_ready(self, generation, palette):
+        if generation != self.palette_generation:
+            return
+        self.palette_task = None
+        self.statusBar().clearMessage()
+        if self.palette_dialog is None:
+            self.palette_dialog = PaletteDialog(self)
+            self.palette_dialog.colorActivated.connect(self.select_color)
+        self.palette_dialog.set_palette(palette)
+        self.palette_dialog.show()
+        self.palette_dialog.raise_()
+        
+    def open_comparison_image(self):
+        if self.image_viewer.pixels is None:
+            QMessageBox.warning(self, "No Image", "Open an image before choosing one to compare with")
+            return
+        if self.image_viewer.high_depth():
+            QMessageBox.information(self, "Compare Images", "Comparison is available for 8-bit images")
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Compare With Image",
+            "",
+            IMAGE_FILE_FILTER
+        )
+        if file_path:
+            self.start_comparison_loading(file_path)
+            
+    def start_comparison_loading(self, file_path):
+        if self.compare_task is not None:
+            self.compare_task.cancel()
+        self.compare_load_generation += 1
+        task = ImageLoadTask(self.compare_load_generation, file_path)
+        task.signals.finished.connect(self.handle_comparison_loaded)
+        task.signals.failed.connect(self.handle_comparison_failed)
+        self.compare_task = task
+        self.running_load_tasks = [t for t in self.running_load_tasks if not t.done]
+        self.running_load_tasks.append(task)
+        self.statusBar().showMessage(f"Loading {file_path} for comparison...")
+        self.thread_pool.start(task)
+        
+    def handle_comparison_loaded(self, generation, image):
+        if generation != self.compare_load_generation:
+            return
+        self.compare_task = None
+        self.statusBar().clearMessage()
+        if self.image_viewer.image is None or image.size() != self.image_viewer.image.size():
+            QMessageBox.warning(self, "Size Mismatch", "Only images of the same size can be compared")
+            return
+        if image.format() != QImage.Format_RGBA8888 or self.image_viewer.high_depth():
+            QMessageBox.information(self, "Compare Images", "Comparison is available for 8-bit images")
+            return
+            
+        self.compare_viewer.set_image(image)
+        self.compare_viewer.show()
+        self.compare_group.show()
+        self.compare_viewer.follow_view(self.image_viewer)
+        self.reset_comparison()
+        
+    def handle_comparison_failed(self, generation, message):
+        if generation != self.compare_load_generation:
+            return
+        self.compare_task = None
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Error", f"Failed to load image: {message}")
+        
+    def reset_comparison(self):
+        # Metrics belong to one pair of images; a replaced main image of
+        # another size ends the comparison
+        self.compare_generation += 1
+        self.comparison = None
+        self.image_viewer.set_difference_overlay(None)
+        if self.compare_viewer.pixels is None:
+            return
+        main = self.image_viewer.pixels
+        if main is None or main.shape != self.compare_viewer.pixels.shape or main.dtype != np.uint8:
+            self.close_comparison()
+            return
+        self.compare_metrics_label.setText("Computing differences...")
+        self.start_analysis(
+            self.compare_generation, self.handle_comparison_ready,
+            ImageComparison, self.image_viewer.pixels, self.compare_viewer.pixels,
+            current=lambda: self.compare_generation
+        )
+        
+    def handle_comparison_ready(self, generation, comparison):
+        if generation != self.compare_generation:
+            return
+        self.comparison = comparison
+        self.update_difference()
+        
+    def update_difference(self):
+        if self.comparison is None:
+            return
+        threshold = self.difference_threshold.value()
+        metrics = self.comparison.metrics(threshold)
+        
+        def psnr(value):
+            return "identical" if math.isinf(value) else f"{value:.2f} dB"
+            
+        lines = [
+            f"Changed: {metrics['changed']:,} of {metrics['pixels']:,} (> {threshold})",
+            f"Max error: {metrics['max_error']}  MSE: {metrics['mse']:.3f}",
+            f"PSNR: {psnr(metrics['psnr'])}",
+        ]
+        for channel, stats in metrics["channels"].items():
+            lines.append(f"{channel.upper()}  max {stats['max_error']:3d}  PSNR {psnr(stats['psnr'])}")
+        self.compare_metrics_label.setText("\n".join(lines))
+        
+        mode = (None,) + ImageComparison.MODES
+        mode = mode[self.difference_mode.currentIndex()]
+        difference = self.comparison.difference_map(mode, threshold) if mode else None
+        self.image_viewer.set_difference_overlay(difference)
+        
+    def select_changed_pixels(self):
+        if self.comparison is None:
+            return
+        ys, xs = np.nonzero(self.comparison.changed_mask(self.difference_threshold.value()))
+        self.selected_pixels.extend(xs, ys, self.image_viewer.pixels[ys, xs])
+        self.image_viewer.add_selection_markers(xs, ys)
+        self.update_pixels_table()
+        
+    def close_comparison(self):
+        if self.compare_task is not None:
+            self.compare_task.cancel()
+            self.compare_task = None
+            self.statusBar().clearMessage()
+        self.compare_load_generation += 1
+        self.compare_generation += 1
+        self.comparison = None
+        self.image_viewer.set_difference_overlay(None)
+        self.compare_viewer.hide()
+        self.compare_viewer.clear_image()
+        self.compare_group.hide()
+        
+    def sync_views(self, source, target):
+        # Keep both viewers in zoom/pan lockstep while comparing
+        if self.syncing_views or target.pixels is None or source.pixels is None:
+            return
+        self.syncing_views = True
+        target.follow_view(source)
+        self.syncing_views = False
+        
+    def handle_rectangle_changed(self, left, top, right, bottom):
+        self.pending_region = ("rectangle", (left, top, right, bottom))
+        self.show_region_stats()
+        
+    def handle_polygon_selected(self, points):
+        self.pending_region = ("polygon", points)
+        self.show_region_stats()
+        
+    def show_region_stats(self):
+        if self.pending_region is None:
+            return
+        if self.region_stats is None:
+            if self.image_viewer.high_depth():
+                self.region_label.setText("Region statistics are available for 8-bit images")
+            else:
+                self.region_label.setText("Preparing region statistics...")
+            return
+            
+        kind, region = self.pending_region
+        if kind == "rectangle":
+            left, top, right, bottom = region
+            stats = self.region_stats.rectangle(left, top, right, bottom)
+            title = f"Rect ({left}, {top}) {right - left} x {bottom - top}"
+        else:
+            stats = self.region_stats.polygon(region)
+            title = f"Lasso, {len(region)} points"
+        if not stats["pixels"]:
+            self.region_label.setText(f"{title}\nNo pixels")
+            return
+            
+        lines = [title, f"Pixels: {stats['pixels']:,}  Coverage: {stats['coverage'] * 100:.1f}%",
+                 " " * 4 + "".join(f"{channel:>8}" for channel in "RGBA")]
+        for name in ("mean", "std", "min", "max"):
+            values = "".join(f"{value:8.2f}" if name in ("mean", "std") else f"{value:8d}"
+                             for value in stats[name])
+            lines.append(f"{name.capitalize():<4}{values}")
+        self.region_label.setText("\n".join(lines))
+        
+    def filter_bounds(self):
+        # Inclusive (low, high) bounds per channel, or None when disabled
+        range_mode = self.filter_mode.currentIndex() == 1
+        bounds = []
+        for spin, second, check in (
+            (self.r_filter, self.r_tolerance, self.r_check),
+            (self.g_filter, self.g_tolerance, self.g_check),
+            (self.b_filter, self.b_tolerance, self.b_check),
+            (self.a_filter, self.a_tolerance, self.a_check),
+        ):
+            if not check.isChecked():
+                bounds.append(None)
+            elif range_mode:
+                bounds.append((min(spin.value(), second.value()), max(spin.value(), second.value())))
+            else:
+                bounds.append((spin.value() - second.value(), spin.value() + second.value()))
+        # Integer bounds keep integer channels from being compared as floats
+        if self.filter_dtype.kind != "f":
+            bounds = [None if limits is None else (int(limits[0]), int(limits[1])) for limits in bounds]
+        return bounds
+        
+    def update_filter_mode(self, index):
+        if index == 1:
+            self.filter_low_header.setText("Min")
+            self.filter_high_header.setText("Max")
+            for spin, second in ((self.r_filter, self.r_tolerance), (self.g_filter, self.g_tolerance),
+                                 (self.b_filter, self.b_tolerance), (self.a_filter, self.a_tolerance)):
+                low, high = spin.value() - second.value(), spin.value() + second.value()
+                spin.setValue(max(spin.minimum(), low))
+                second.setValue(min(second.maximum(), high))
+        else:
+            self.filter_low_header.setText("Value")
+            self.filter_high_header.setText("\u00b1")
+            for spin, second in ((self.r_filter, self.r_tolerance), (self.g_filter, self.g_tolerance),
+                                 (self.b_filter, self.b_tolerance), (self.a_filter, self.a_tolerance)):
+                low, high = sorted((spin.value(), second.value()))
+                if self.filter_dtype.kind == "f":
+                    spin.setValue((low + high) / 2)
+                    second.setValue((high - low) / 2)
+                else:
+                    spin.setValue((low + high) // 2)
+                    second.setValue((high - low + 1) // 2)
+        self.schedule_live_filter()
+        
+    def schedule_live_filter(self):
+        if self.mask_filter is not None:
+            self.filter_timer.start()
+            
+    def compile_filter_expression(self):
+        text = self.filter_expression_input.text().strip()
+        if text == (self.filter_expression.source if self.filter_expression else ""):
+            return
+        try:
+            expression = FilterExpression(text) if text else None
+        except ValueError as e:
+            # Keep filtering with the last valid expression
+            self.filter_matches_label.setText(f"Expression error: {e}")
+            return
+        self.filter_expression = expression
+        self.expression_mask = None
+        self.schedule_live_filter()
+        
+    @PERF.timed("filter.live")
+    def update_live_filter(self):
+        mask = self.mask_filter.evaluate(self.filter_bounds())
+        if self.filter_expression is not None:
+            if self.expression_mask is None:
+                self.expression_mask = self.filter_expression.evaluate(self.image_viewer.pixels)
+            mask = self.expression_mask if mask is None else mask & self.expression_mask
+        self.filter_mask = mask
+        
+        self.image_viewer.set_mask_overlay(mask if self.live_filter_check.isChecked() else None)
+        if self.histogram_source.currentIndex() == 2:
+            self.update_histogram()
+        if mask is None:
+            self.filter_matches_label.setText("Matches: N/A")
+            return
+            
+        box = mask_bounding_box(mask)
+        bounds_text = f"({box[0]}, {box[1]}) - ({box[2]}, {box[3]})" if box else "none"
+        self.filter_matches_label.setText(
+            f"Matches: {int(np.count_nonzero(mask)):,}  Bounds: {bounds_text}"
+        )
+        
+    @PERF.timed("filter.select")
+    def select_filter_matches(self):
+        if self.mask_filter is None:
+            return
+        if self.filter_timer.isActive():
+            self.filter_timer.stop()
+            self.update_live_filter()
+        if self.filter_mask is None:
+            return
+            
+        ys, xs = np.nonzero(self.filter_mask)
+        self.selected_pixels.extend(xs, ys, self.image_viewer.pixels[ys, xs])
+        self.image_viewer.add_selection_markers(xs, ys)
+        self.update_pixels_table()
+        
+    @PERF.timed("filter.apply")
+    def apply_filters(self):
+        if not self.selected_pixels:
+            return
+            
+        # Filter selected pixels column-wise
+        keep = self.selected_pixels.range_mask(self.filter_bounds())
+        if self.filter_expression is not None:
+            keep &= self.filter_expression.evaluate_values(
+                self.selected_pixels.rgba, self.selected_pixels.xs, self.selected_pixels.ys
+            )
+        self.selected_pixels.keep(keep)
+        self.image_viewer.refresh_selection_markers()
+        self.update_pixels_table()
+        
+    def remove_duplicates(self):
+        if self.selected_pixels.deduplicate():
+            self.image_viewer.refresh_selection_markers()
+            self.update_pixels_table()
+            
     def clear_all(self):
-        self.selected_pixels = []
+        # The selection stores values in the channel type of the shown image
+        pixels = self.image_viewer.pixels
+        self.selected_pixels.clear(None if pixels is None else pixels.dtype)
         self.update_pixels_table()
         self.image_viewer.clear_selection()
         self.pos_label.setText("Position: N/A")
         self.rgba_label.setText("RGBA: N/A")
         self.hex_label.setText("Hex: N/A")
-        self.color_preview.setStyleSheet("background-color: black; border: 1px solid #555;")
+        self.color_preview.set_color(QColor(Qt.black))
         
-    def export_to_csv(self):
-        if not self.selected_pixels:
-            QMessageBox.warning(self, "No Data", "There are no pixels to export")
-            return
-            
-        file_path, _ = QFileDialog.getSaveFileName(
+    def choose_export_path(self, title):
+        file_path, selected_filter = QFileDialog.getSaveFileName(
             self,
-            "Export to CSV",
+            title,
             "",
-            "CSV Files (*.csv)"
+            "CSV Files (*.csv);;NumPy Array (*.npy);;NumPy Archive (*.npz)"
         )
+        if file_path and not file_path.lower().endswith((".csv", ".npy", ".npz")):
+            file_path += selected_filter[selected_filter.index("*") + 1:-1]
+        return file_path
         
+    def export_selection(self):
+        if not self.selected_pixels:
+            QMessageBox.warning(self, "No Data", "There are no pixels to export")
+            return
+        file_path = self.choose_export_path("Export Selection")
         if file_path:
-            try:
-                with open(file_path, 'w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['X', 'Y', 'R', 'G', 'B', 'A', 'Hex'])
-                    for pixel in self.selected_pixels:
-                        hex_color = pixel['color'].name()
-                        writer.writerow([
-                            pixel['x'], pixel['y'], 
-                            pixel['r'], pixel['g'], pixel['b'], pixel['a'],
-                            hex_color
-                        ])
-                QMessageBox.information(self, "Success", "Data exported successfully")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to export data: {str(e)}")
-                
+            # Snapshot the columns so the selection can keep changing meanwhile
+            xs = self.selected_pixels.xs.copy()
+            ys = self.selected_pixels.ys.copy()
+            rgba = self.selected_pixels.rgba.copy()
+            self.start_export(file_path, lambda: iter_array_chunks(xs, ys, rgba), len(xs), rgba.dtype)
+            
+    def export_matches(self):
+        if self.mask_filter is None:
+            return
+        if self.filter_timer.isActive():
+            self.filter_timer.stop()
+            self.update_live_filter()
+        if self.filter_mask is None:
+            QMessageBox.warning(self, "No Filter", "Enable a channel filter or enter an expression to export its matches")
+            return
+        file_path = self.choose_export_path("Export Filter Matches")
+        if file_path:
+            # The filter reuses its mask buffer, so the export gets its own copy
+            mask = self.filter_mask.copy()
+            pixels = self.image_viewer.pixels
+            self.start_export(file_path, lambda: iter_mask_chunks(pixels, mask),
+                              int(np.count_nonzero(mask)), pixels.dtype)
+                              
+    def start_export(self, file_path, chunks, count, channel_dtype=np.uint8):
+        if self.export_task is not None:
+            QMessageBox.warning(self, "Export Running", "Wait for the current export to finish or cancel it")
+            return
+        task = ExportTask(file_path, chunks, count, channel_dtype=channel_dtype)
+        task.signals.progress.connect(self.export_progress.setValue)
+        task.signals.finished.connect(self.handle_export_finished)
+        task.signals.failed.connect(self.handle_export_failed)
+        task.signals.cancelled.connect(self.handle_export_cancelled)
+        self.export_task = task
+        self.running_analysis_tasks = [t for t in self.running_analysis_tasks if not t.done]
+        self.running_analysis_tasks.append(task)
+        
+        self.export_progress.setValue(0)
+        self.export_progress.show()
+        self.export_cancel_btn.show()
+        self.thread_pool.start(task)
+        
+    def cancel_export(self):
+        if self.export_task is not None:
+            self.export_task.cancel()
+            
+    def finish_export(self):
+        self.export_task = None
+        self.export_progress.hide()
+        self.export_cancel_btn.hide()
+        
+    def handle_export_finished(self, file_path, rows):
+        self.finish_export()
+        self.statusBar().showMessage(f"Exported {rows:,} pixels to {file_path}", 5000)
+        
+    def handle_export_failed(self, message):
+        self.finish_export()
+        QMessageBox.critical(self, "Error", f"Failed to export data: {message}")
+        
+    def handle_export_cancelled(self):
+        self.finish_export()
+        self.statusBar().showMessage("Export cancelled", 3000)
+        
     def setup_dev_tab(self):
         layout = QVBoxLayout(self.dev_tab)
         layout.setAlignment(Qt.AlignCenter)
@@ -656,8 +3481,13 @@ class RGBAnalyzer(QMainWindow):
         layout.addWidget(dev_group)
 
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    if len(argv) > 1 and argv[1] == "batch":
+        from pixel_batch import run_batch
+        return run_batch(argv[2:])
+        
+    app = QApplication(argv)
     
     # Set application style
     app.setStyle("Fusion")
@@ -666,4 +3496,8 @@ if __name__ == "__main__":
     window = RGBAnalyzer()
     window.show()
     
-    sys.exit(app.exec())
+    return app.exec()
+
+
+if __name__ == "__main__":
+    sys.exit(main())